@@ -0,0 +1,345 @@
+"""
+End-to-end throughput benchmark for the Discord queue consumer.
+
+Pushes synthetic create_thread messages through
+DiscordSQSManager -> DiscordSQSConsumer.process_message -> SCMarket.order_placed
+using the in-process SQS emulator and a stand-in for the Discord REST API with
+injectable latency and 429 responses.
+
+Usage (from the repository root):
+
+    python -m benchmarks.consumer_throughput --messages 2000 --discord-latency 0.05 --rate-limit 0.02
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Any, List
+
+# The emulator (and in-memory idempotency and journal stores) have to be selected before Config is imported
+os.environ['SQS_TRANSPORT'] = 'local'
+os.environ.setdefault('DISCORD_API_KEY', 'benchmark')
+os.environ.setdefault('IDEMPOTENCY_DB', '')
+os.environ.setdefault('ORDER_JOURNAL_DB', '')
+
+import aiohttp
+import discord
+
+from main import SCMarket, intents
+from util import codec
+from util.config import Config
+from util.discord_sqs_consumer import DiscordSQSManager
+from util.sqs_client import SQSClient
+from util.sqs_message import string_attributes
+from util.logging_config import LoggingConfig
+from util.metrics import metrics
+
+SERVER_ID = 100000000000000001
+CHANNEL_ID = 100000000000000002
+
+
+class FakeDiscordAPI:
+    """Stand-in for the Discord REST API that injects latency and 429 responses"""
+
+    def __init__(self, latency: float, jitter: float, rate_limit_probability: float, retry_after: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.rate_limited = Counter()
+
+    async def call(self, operation: str):
+        """Simulate one REST round trip, retrying after a 429 the way discord.py does"""
+        while True:
+            self.calls[operation] += 1
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+            if random.random() >= self.rate_limit_probability:
+                return
+            self.rate_limited[operation] += 1
+            await asyncio.sleep(self.retry_after)
+
+
+class _FakeResponse:
+    """Minimal HTTP response used to construct discord.py exceptions"""
+
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class FakeInvite:
+    def __init__(self, code: str):
+        self.code = code
+
+    def __str__(self):
+        return f"https://discord.gg/{self.code}"
+
+
+class FakeThread:
+    def __init__(self, api: FakeDiscordAPI, name: str):
+        self.api = api
+        self.id = random.getrandbits(62)
+        self.name = name
+
+    async def add_user(self, user):
+        await self.api.call('add_thread_member')
+
+
+class FakeChannel:
+    def __init__(self, api: FakeDiscordAPI, channel_id: int):
+        self.api = api
+        self.id = channel_id
+        self.name = 'fulfillment'
+
+    async def create_thread(self, name: str, type=None, **kwargs):
+        await self.api.call('create_thread')
+        return FakeThread(self.api, name)
+
+    async def create_invite(self, **kwargs):
+        await self.api.call('create_invite')
+        return FakeInvite(uuid.uuid4().hex[:8])
+
+
+class FakeGuild:
+    def __init__(self, api: FakeDiscordAPI, guild_id: int, non_member_ratio: float):
+        self.api = api
+        self.id = guild_id
+        self.name = 'benchmark-guild'
+        self.non_member_ratio = non_member_ratio
+        self.channels = {CHANNEL_ID: FakeChannel(api, CHANNEL_ID)}
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id: int):
+        await self.api.call('fetch_channel')
+        return self.channels.get(channel_id)
+
+    def get_thread(self, thread_id: int):
+        return None
+
+    async def fetch_member(self, member_id: int):
+        await self.api.call('fetch_member')
+        if random.random() < self.non_member_ratio:
+            raise discord.NotFound(_FakeResponse(404, 'Not Found'), 'Unknown Member')
+        return discord.Object(member_id)
+
+
+class BenchmarkBot(SCMarket):
+    """SCMarket wired to the Discord stand-in instead of a gateway connection"""
+
+    def __init__(self, api: FakeDiscordAPI, non_member_ratio: float):
+        super().__init__(intents=intents, command_prefix="/")
+        self.api = api
+        self.fake_guild = FakeGuild(api, SERVER_ID, non_member_ratio)
+
+    @property
+    def user(self):
+        return discord.Object(1)
+
+    def get_guild(self, guild_id: int):
+        return None
+
+    async def fetch_guild(self, guild_id: int, *args, **kwargs):
+        await self.api.call('fetch_guild')
+        return self.fake_guild if guild_id == SERVER_ID else None
+
+    async def fetch_user(self, user_id: int):
+        await self.api.call('fetch_user')
+        return discord.Object(user_id)
+
+    async def fetch_invite(self, url, *args, **kwargs):
+        await self.api.call('fetch_invite')
+        return FakeInvite(str(url))
+
+
+class LatencyTransport:
+    """Wraps an SQS transport to add a simulated network round trip per call"""
+
+    def __init__(self, transport, latency: float):
+        self.transport = transport
+        self.latency = latency
+
+    async def request(self, operation: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await self.transport.request(operation, params)
+
+    async def close(self):
+        await self.transport.close()
+
+
+def make_create_thread_message(entity_id: str, member_count: int) -> Dict[str, Any]:
+    """Build a synthetic create_thread message as the backend would send it"""
+    return {
+        'type': 'create_thread',
+        'payload': {
+            'server_id': str(SERVER_ID),
+            'channel_id': str(CHANNEL_ID),
+            'members': [str(random.getrandbits(60)) for _ in range(member_count)],
+            'order': {'order_id': entity_id, 'title': 'Benchmark order'},
+            'customer_discord_id': str(random.getrandbits(60)),
+            'entity_info': {'id': entity_id, 'type': 'order'}
+        },
+        'metadata': {
+            'order_id': entity_id,
+            'entity_type': 'order',
+            'created_at': time.time()
+        }
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    api = FakeDiscordAPI(args.discord_latency, args.discord_jitter, args.rate_limit, args.retry_after)
+    bot = BenchmarkBot(api, args.non_member_ratio)
+    bot.session = aiohttp.ClientSession()
+
+    manager = DiscordSQSManager(bot)
+    if not await manager.initialize():
+        raise RuntimeError("Failed to initialize the Discord SQS manager")
+
+    local_sqs = manager.sqs_client.sqs
+    manager.sqs_client.sqs = LatencyTransport(local_sqs, args.sqs_latency)
+
+    sent_at = {}
+    producer_calls = Counter()
+
+    async def produce():
+        """Send the synthetic load in batches of 10, paced by --arrival-rate when set"""
+        for start in range(0, args.messages, 10):
+            entries = []
+            for i in range(start, min(start + 10, args.messages)):
+                entity_id = str(uuid.uuid4())
+                sent_at[entity_id] = time.time()
+                body, body_attributes = codec.encode_body(make_create_thread_message(entity_id, args.members))
+                entries.append({
+                    'Id': str(i),
+                    'MessageBody': body,
+                    # Routing attributes, as the backend sets them, let the consumer dedupe before decoding
+                    'MessageAttributes': SQSClient._format_message_attributes(
+                        {'type': 'create_thread', 'entity_id': entity_id, 'server_id': str(SERVER_ID), **body_attributes}
+                    )
+                })
+            await local_sqs.request('SendMessageBatch', {'QueueUrl': Config.DISCORD_QUEUE_URL, 'Entries': entries})
+            producer_calls['SendMessageBatch'] += 1
+            if args.arrival_rate:
+                await asyncio.sleep(len(entries) / args.arrival_rate)
+
+    producer_task = None
+    if args.arrival_rate:
+        producer_task = asyncio.create_task(produce())
+    else:
+        # Enqueue everything before the consumer starts so it sees a real backlog
+        await produce()
+
+    started = time.time()
+    await manager.start_consumer()
+
+    # Drain responses from the backend queue and measure end-to-end latency
+    latencies, failures, collector_calls = [], 0, Counter()
+    deadline = started + args.timeout
+    while len(latencies) + failures < args.messages and time.time() < deadline:
+        response = await local_sqs.request('ReceiveMessage', {
+            'QueueUrl': Config.BACKEND_QUEUE_URL,
+            'MaxNumberOfMessages': 10,
+            'WaitTimeSeconds': 1,
+            'MessageAttributeNames': [codec.CONTENT_ENCODING_ATTRIBUTE]
+        })
+        collector_calls['ReceiveMessage'] += 1
+        messages = response.get('Messages', [])
+        for message in messages:
+            attributes = string_attributes(message)
+            body = codec.decode_body(message['Body'], attributes.get(codec.CONTENT_ENCODING_ATTRIBUTE))
+            entity_id = body['metadata'].get('original_order_id')
+            if body['type'] == 'thread_created' and entity_id in sent_at:
+                latencies.append(time.time() - sent_at[entity_id])
+            else:
+                failures += 1
+        if messages:
+            await local_sqs.request('DeleteMessageBatch', {
+                'QueueUrl': Config.BACKEND_QUEUE_URL,
+                'Entries': [{'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(messages)]
+            })
+            collector_calls['DeleteMessageBatch'] += 1
+    elapsed = time.time() - started
+
+    if producer_task:
+        producer_task.cancel()
+    await manager.shutdown()
+    await bot.session.close()
+
+    consumer_calls = local_sqs.call_counts - producer_calls - collector_calls
+    processed = len(latencies) + failures
+    return {
+        'messages': args.messages,
+        'completed': len(latencies),
+        'failed': failures,
+        'elapsed': elapsed,
+        'throughput': processed / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'sqs_calls': dict(consumer_calls),
+        'sqs_calls_per_message': sum(consumer_calls.values()) / max(1, processed),
+        'discord_calls': dict(api.calls),
+        'discord_calls_per_message': sum(api.calls.values()) / max(1, processed),
+        'rate_limited': sum(api.rate_limited.values()),
+        'stages': [entry for entry in metrics.snapshot() if entry['type'] == 'histogram' and entry['count']]
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    print("=" * 60)
+    print("Discord queue consumer throughput")
+    print("=" * 60)
+    print(f"Codec:               {codec.BACKEND}, {Config.SQS_COMPRESSION} compression")
+    print(f"Messages:            {result['completed']}/{result['messages']} completed, {result['failed']} failed")
+    print(f"Elapsed:             {result['elapsed']:.2f}s")
+    print(f"Throughput:          {result['throughput']:.1f} messages/sec")
+    print(f"Latency p50/p95/p99: {result['p50'] * 1000:.0f} / {result['p95'] * 1000:.0f} / {result['p99'] * 1000:.0f} ms")
+    print(f"SQS calls/message:   {result['sqs_calls_per_message']:.2f} {result['sqs_calls']}")
+    print(f"Discord calls/msg:   {result['discord_calls_per_message']:.2f} {result['discord_calls']}")
+    print(f"429 responses:       {result['rate_limited']}")
+    print("Stage latency p50/p99 (ms):")
+    for stage in result['stages']:
+        labels = ','.join(f"{name}={value}" for name, value in stage['labels'].items())
+        print(f"  {stage['name']}{{{labels}}}: {stage['p50'] * 1000:.1f} / {stage['p99'] * 1000:.1f} (n={stage['count']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Discord queue consumer end to end")
+    parser.add_argument('--messages', type=int, default=1000, help="Number of create_thread messages to push")
+    parser.add_argument('--arrival-rate', type=float, default=0.0,
+                        help="Messages/sec sent while consuming (0 enqueues everything up front as a backlog)")
+    parser.add_argument('--members', type=int, default=2, help="Members added to each thread")
+    parser.add_argument('--discord-latency', type=float, default=0.05, help="Mean Discord REST latency in seconds")
+    parser.add_argument('--discord-jitter', type=float, default=0.01, help="Standard deviation of Discord latency")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="Probability that a Discord call returns 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After applied to each 429 in seconds")
+    parser.add_argument('--non-member-ratio', type=float, default=0.2, help="Share of customers not in the guild")
+    parser.add_argument('--sqs-latency', type=float, default=0.005, help="Simulated SQS round trip in seconds")
+    parser.add_argument('--timeout', type=float, default=600, help="Give up after this many seconds")
+    args = parser.parse_args()
+
+    # Per-message INFO logging would dominate the measurement
+    for component in LoggingConfig.COMPONENT_LEVELS:
+        logging.getLogger(component).setLevel(logging.WARNING)
+
+    print_report(asyncio.run(run_benchmark(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,9 @@ from discord import app_commands
 import logging
 from typing import List, Optional
 
+from util import codec
+from util.sqs_message import string_attributes
+
 logger = logging.getLogger('SCMarketBot.AdminCog')
 
 class Admin(commands.GroupCog):
@@ -87,17 +90,13 @@ class Admin(commands.GroupCog):
                 await interaction.response.send_message("SQS manager not initialized", ephemeral=True)
                 return
             
-            await interaction.response.send_message("🔄 Restarting SQS consumer...", ephemeral=True)
+            await interaction.response.send_message("🔄 Draining and restarting SQS consumer...", ephemeral=True)
             
             manager = self.bot.discord_sqs_manager
             
-            # Stop current consumer
+            # Drain the current consumer: in-flight messages finish and unstarted ones go straight back to the queue
             await manager.stop_consumer()
             
-            # Wait a moment
-            import asyncio
-            await asyncio.sleep(2)
-            
             # Restart consumer
             await manager.start_consumer()
             
@@ -130,13 +129,15 @@ class Admin(commands.GroupCog):
             from util.config import Config
             queue_name = Config.DISCORD_QUEUE_URL.split('/')[-1]
             
-            # Get queue attributes
-            attributes = await manager.sqs_client.get_queue_attributes(queue_name)
+            # Read the shared sampler's cached metrics (the full URL avoids a GetQueueUrl lookup)
+            metrics = await manager.sqs_client.get_queue_metrics(Config.DISCORD_QUEUE_URL)
             
-            if not attributes:
+            if not metrics:
                 await interaction.response.send_message("Could not retrieve queue attributes", ephemeral=True)
                 return
             
+            attributes = metrics['attributes']
+            
             # Create queue status embed
             embed = discord.Embed(
                 title=f"Queue Status: {queue_name}",
@@ -145,7 +146,7 @@ class Admin(commands.GroupCog):
             )
             
             # Queue depth
-            depth = int(attributes.get('ApproximateNumberOfMessages', 0))
+            depth = metrics['depth']
             depth_color = "🟢" if depth < 10 else "🟡" if depth < 100 else "🔴"
             embed.add_field(
                 name="Queue Depth",
@@ -154,7 +155,7 @@ class Admin(commands.GroupCog):
             )
             
             # In-flight messages
-            in_flight = int(attributes.get('ApproximateNumberOfMessagesNotVisible', 0))
+            in_flight = metrics['in_flight']
             embed.add_field(
                 name="In Flight",
                 value=f"{in_flight} messages",
@@ -188,12 +189,111 @@ class Admin(commands.GroupCog):
                     inline=True
                 )
             
+            # Sample freshness
+            sample_age = discord.utils.utcnow().timestamp() - metrics['sampled_at']
+            embed.set_footer(text=f"Sampled {sample_age:.0f}s ago")
+            
             await interaction.response.send_message(embed=embed, ephemeral=True)
             
         except Exception as e:
             logger.error(f"Error getting queue status: {e}")
             await interaction.response.send_message(f"Error getting queue status: {e}", ephemeral=True)
     
+    @app_commands.command(name="quarantine_list")
+    @app_commands.describe(
+        limit='Number of most recent entries to show (max 25)'
+    )
+    async def quarantine_list(self, interaction: discord.Interaction, limit: int = 10):
+        """List poison messages moved to the local quarantine store"""
+        # Check permissions first
+        if not await self._permission_check(interaction):
+            return
+        
+        logger.info(f"Quarantine list requested by {interaction.user.id} ({interaction.user.name})")
+        
+        try:
+            if not hasattr(self.bot, 'discord_sqs_manager') or not self.bot.discord_sqs_manager:
+                await interaction.response.send_message("SQS manager not initialized", ephemeral=True)
+                return
+            
+            sqs_client = self.bot.discord_sqs_manager.sqs_client
+            entries = sqs_client.list_quarantined(max(1, min(limit, 25)))
+            
+            embed = discord.Embed(
+                title="Quarantined Messages",
+                color=discord.Color.orange(),
+                timestamp=discord.utils.utcnow()
+            )
+            
+            if not entries:
+                embed.description = "No quarantined messages"
+            
+            for entry in entries:
+                attributes = string_attributes({'MessageAttributes': entry['message_attributes']})
+                try:
+                    # Show compressed bodies decoded
+                    preview = codec.dumps(codec.decode_body(
+                        entry['body'],
+                        attributes.get(codec.CONTENT_ENCODING_ATTRIBUTE)
+                    ))[:200]
+                except codec.DecodeError:
+                    preview = entry['body'][:200]
+                embed.add_field(
+                    name=f"{entry['id']} ({entry['receive_count']} receives)",
+                    value=f"Reason: {entry['reason'][:200]}\n"
+                          f"Quarantined: <t:{int(entry['quarantined_at'])}:R>\n"
+                          f"```{preview}```",
+                    inline=False
+                )
+            
+            embed.set_footer(text=f"{sqs_client.get_quarantine_store().count()} quarantined in total")
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        
+        except Exception as e:
+            logger.error(f"Error listing quarantined messages: {e}")
+            await interaction.response.send_message(f"Error listing quarantined messages: {e}", ephemeral=True)
+    
+    @app_commands.command(name="quarantine_redrive")
+    @app_commands.describe(
+        entry_id='Quarantine entry ID to send back to its source queue, or "all"'
+    )
+    async def quarantine_redrive(self, interaction: discord.Interaction, entry_id: str):
+        """Send quarantined messages back to the queue they came from"""
+        # Check permissions first
+        if not await self._permission_check(interaction):
+            return
+        
+        logger.info(f"Quarantine re-drive of {entry_id} requested by {interaction.user.id} ({interaction.user.name})")
+        
+        try:
+            if not hasattr(self.bot, 'discord_sqs_manager') or not self.bot.discord_sqs_manager:
+                await interaction.response.send_message("SQS manager not initialized", ephemeral=True)
+                return
+            
+            await interaction.response.defer(ephemeral=True)
+            
+            sqs_client = self.bot.discord_sqs_manager.sqs_client
+            if entry_id.lower() == "all":
+                entry_ids = [entry['id'] for entry in sqs_client.list_quarantined(sqs_client.get_quarantine_store().count())]
+            else:
+                entry_ids = [entry_id]
+            
+            redriven = 0
+            for quarantined_id in entry_ids:
+                if await sqs_client.redrive_quarantined(quarantined_id):
+                    redriven += 1
+            
+            failed = len(entry_ids) - redriven
+            status = "✅" if failed == 0 else "⚠️"
+            await interaction.followup.send(
+                f"{status} Re-drove {redriven} message(s)" + (f", {failed} failed" if failed else ""),
+                ephemeral=True
+            )
+        
+        except Exception as e:
+            logger.error(f"Error re-driving quarantined messages: {e}")
+            await interaction.followup.send(f"❌ Error re-driving quarantined messages: {e}", ephemeral=True)
+    
     @app_commands.command(name="admin_info")
     async def admin_info(self, interaction: discord.Interaction):
         """Show admin configuration information (for debugging)"""
@@ -349,6 +449,19 @@ class Admin(commands.GroupCog):
                     inline=True
                 )
         
+        # Per-lane concurrency
+        if health_status.get('lanes'):
+            lane_lines = [
+                f"{name} (p{lane['priority']}): {lane['active']}/{lane['concurrency']} active, "
+                f"{lane['waiting']} waiting, {lane['processed']} done"
+                for name, lane in sorted(health_status['lanes'].items(), key=lambda item: item[1]['priority'])
+            ]
+            embed.add_field(
+                name="Lanes",
+                value="\n".join(lane_lines),
+                inline=False
+            )
+        
         await interaction.followup.send(embed=embed, ephemeral=True)
     
     async def _check_general_health(self, interaction: discord.Interaction):
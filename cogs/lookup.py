@@ -93,6 +93,7 @@ class Lookup(commands.Cog):
             listings = await public_fetch(
                 f"/market/user/{handle}",
                 session=self.bot.session,
+                endpoint="/market/user/:handle",
             )
         except:
             await interaction.response.send_message("Invalid user")
@@ -126,6 +127,7 @@ class Lookup(commands.Cog):
             listings = await public_fetch(
                 f"/market/contractor/{spectrum_id}",
                 session=self.bot.session,
+                endpoint="/market/contractor/:spectrum_id",
             )
         except:
             await interaction.response.send_message("Invalid org")
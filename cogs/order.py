@@ -1,13 +1,12 @@
-import json
 import logging
 import traceback
 from typing import List
 
 import discord
-import ujson
 from discord import app_commands
 from discord.ext import commands
 
+from util import codec
 from util.fetch import internal_post, get_user_orders
 
 logger = logging.getLogger('SCMarketBot.OrderCog')
@@ -53,7 +52,7 @@ class order(commands.GroupCog):
                     return
             else:
                 try:
-                    order_payload = json.loads(order)
+                    order_payload = codec.loads(order)
                     logger.debug(f"Updating status for specific order {order_payload.get('o')} to {newstatus}")
                     response = await internal_post(
                         "/threads/order/status",
@@ -64,7 +63,7 @@ class order(commands.GroupCog):
                         },
                         session=self.bot.session
                     )
-                except json.JSONDecodeError as e:
+                except codec.DecodeError as e:
                     logger.error(f"Failed to parse order JSON: {e}")
                     logger.error(f"Raw order string: {order}")
                     await interaction.response.send_message("Invalid order format. Please try again.", ephemeral=True)
@@ -107,7 +106,7 @@ class order(commands.GroupCog):
             
             choices = [
                 app_commands.Choice(name=order['title'],
-                                    value=ujson.dumps(dict(t=order['title'], o=order['order_id'])))
+                                    value=codec.dumps(dict(t=order['title'], o=order['order_id'])))
                 for order in orders if
                 (current.lower() in order['title'].lower() or current.lower() in order['description'].lower()) and
                 order['status'] != interaction.namespace.newstatus
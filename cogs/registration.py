@@ -1,4 +1,3 @@
-import json
 import os
 import traceback
 
@@ -8,6 +7,8 @@ from discord import app_commands
 from discord.app_commands import checks
 from discord.ext import commands
 
+from util import codec
+
 DISCORD_BACKEND_URL = os.environ.get("DISCORD_BACKEND_URL", "http://web:8081")
 
 
@@ -58,7 +59,7 @@ class Registration(commands.GroupCog, name="register"):
 
     @staticmethod
     async def register(interaction, type, entity, name=""):
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=codec.dumps) as session:
             payload = dict(
                 discord_id=str(interaction.user.id),
                 channel_id=str(interaction.channel.id) if type == "channel" else None,
@@ -71,7 +72,7 @@ class Registration(commands.GroupCog, name="register"):
             ) as resp:
                 try:
                     text = await resp.text()
-                    result = json.loads(text)  # await resp.json()
+                    result = codec.loads(text)  # await resp.json()
                 except Exception as e:
                     traceback.print_exc()
                     print(text)
@@ -1,13 +1,12 @@
-import json
 import logging
 import traceback
 from typing import List
 
 import discord
-import ujson
 from discord import app_commands
 from discord.ext import commands
 
+from util import codec
 from util.fetch import internal_post, get_user_listings, get_user_orgs, get_org_listings
 from util.listings import display_listings_compact
 
@@ -73,9 +72,9 @@ class stock(commands.GroupCog):
         try:
             # Parse listing payload
             try:
-                listing_payload = json.loads(listing)
+                listing_payload = codec.loads(listing)
                 logger.debug(f"Parsed listing payload: {listing_payload}")
-            except json.JSONDecodeError as e:
+            except codec.DecodeError as e:
                 logger.error(f"Failed to parse listing JSON: {e}")
                 logger.error(f"Raw listing string: {listing}")
                 await interaction.response.send_message("Invalid listing format. Please try again.", ephemeral=True)
@@ -137,11 +136,11 @@ class stock(commands.GroupCog):
         try:
             if owner and interaction.namespace.owner != "_ME":
                 try:
-                    owner_payload = json.loads(owner)
+                    owner_payload = codec.loads(owner)
                     logger.debug(f"Fetching org listings for contractor {owner_payload['s']}")
                     listings = await get_org_listings(owner_payload['s'], interaction.user.id,
                                                       session=self.bot.session)
-                except json.JSONDecodeError as e:
+                except codec.DecodeError as e:
                     logger.error(f"Failed to parse owner JSON: {e}")
                     logger.error(f"Raw owner string: {owner}")
                     await interaction.response.send_message("Invalid owner format. Please try again.", ephemeral=True)
@@ -180,11 +179,11 @@ class stock(commands.GroupCog):
             
             if interaction.namespace.owner != "_ME":
                 try:
-                    owner = json.loads(interaction.namespace.owner)
+                    owner = codec.loads(interaction.namespace.owner)
                     logger.debug(f"Fetching org listings for contractor {owner['s']}")
                     listings = await get_org_listings(owner['s'], interaction.user.id,
                                                       session=self.bot.session)
-                except json.JSONDecodeError as e:
+                except codec.DecodeError as e:
                     logger.error(f"Failed to parse owner JSON in autocomplete: {e}")
                     logger.error(f"Raw owner string: {interaction.namespace.owner}")
                     return []
@@ -199,7 +198,7 @@ class stock(commands.GroupCog):
             choices = [
                           app_commands.Choice(
                               name=f"{listing['title'][:100]} ({int(listing['quantity_available']):,} available)",
-                              value=ujson.dumps(dict(l=listing['listing_id'], t=listing['title'],
+                              value=codec.dumps(dict(l=listing['listing_id'], t=listing['title'],
                                                      q=int(listing['quantity_available'])))
                           )
                           for listing in listings if
@@ -233,7 +232,7 @@ class stock(commands.GroupCog):
 
             choices = [
                 app_commands.Choice(name=f"{org['name']} ({org['spectrum_id']})",
-                                    value=json.dumps(dict(s=org['spectrum_id'], n=org['name'])))
+                                    value=codec.dumps(dict(s=org['spectrum_id'], n=org['name'])))
                 for org in orgs if
                 current.lower() in org['name'].lower() or current.lower() in org['spectrum_id'].lower()
             ][:24] + [app_commands.Choice(name=f"Me", value='_ME')]
@@ -17,10 +17,16 @@ from cogs.order import order
 from cogs.registration import Registration
 from cogs.stock import stock
 
+from util import codec
 from util.config import Config
 from util.result import Result
 from util.discord_sqs_consumer import DiscordSQSManager
+from util.discord_resolver import DiscordResolver
+from util.invite_manager import InviteManager
+from util.health_server import HealthServer
 from util.logging_config import LoggingConfig
+from util.metrics import metrics
+from util.order_journal import OrderJournal, OrderCheckpoint
 
 intents = discord.Intents.default()
 intents.members = True
@@ -33,8 +39,52 @@ logger = LoggingConfig.setup_logging()
 class SCMarket(Bot):
     session = None
     discord_sqs_manager = None
+    order_journal = None
+    health_server = None
+    resolver = None
+    invite_manager = None
+
+    def get_resolver(self) -> DiscordResolver:
+        """Get the guild/channel resolver, creating it (and its invalidation listeners) on first use"""
+        if self.resolver is None:
+            self.resolver = DiscordResolver(self, Config.DISCORD_RESOLVE_CACHE_TTL)
+        return self.resolver
+
+    def get_invite_manager(self) -> InviteManager:
+        """Get the invite manager, starting its background sweep on first use"""
+        if self.invite_manager is None:
+            settings = Config.DISCORD_INVITE_SETTINGS
+            self.invite_manager = InviteManager(
+                self,
+                settings['max_age'],
+                settings['max_uses'],
+                settings['min_remaining'],
+                settings['sweep_interval']
+            )
+            self.invite_manager.start()
+        return self.invite_manager
+
+    def get_order_journal(self) -> OrderJournal:
+        """Get the order step journal, opening it and starting its expiry sweep on first use"""
+        if self.order_journal is None:
+            self.order_journal = OrderJournal(
+                Config.ORDER_JOURNAL_SETTINGS['db_path'] or None,
+                Config.ORDER_JOURNAL_SETTINGS['ttl'],
+                Config.ORDER_JOURNAL_SETTINGS['sweep_interval']
+            )
+            self.order_journal.start()
+        return self.order_journal
 
     async def setup_hook(self):
+        # Serve probes before anything slow so the orchestrator sees the process as alive
+        if Config.HEALTH_SERVER_ENABLED:
+            try:
+                self.health_server = HealthServer(self, Config.HEALTH_SERVER_HOST, Config.HEALTH_SERVER_PORT)
+                await self.health_server.start()
+            except Exception as e:
+                logger.error(f"Failed to start health server on port {Config.HEALTH_SERVER_PORT}: {e}")
+                self.health_server = None
+
         await self.add_cog(Registration(self))
         await self.add_cog(Admin(self))
         await self.add_cog(Lookup(self))
@@ -58,7 +108,7 @@ class SCMarket(Bot):
 
         # Initialize aiohttp session
         try:
-            self.session = aiohttp.ClientSession()
+            self.session = aiohttp.ClientSession(json_serialize=codec.dumps)
             logger.info("aiohttp session initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize aiohttp session: {e}")
@@ -98,6 +148,14 @@ class SCMarket(Bot):
         """Clean up resources when the bot shuts down"""
         logger.info("Bot shutdown initiated, cleaning up resources...")
         
+        # Drain the consumer first: in-flight handlers still need the HTTP session
+        try:
+            if hasattr(self, 'discord_sqs_manager') and self.discord_sqs_manager:
+                await self.discord_sqs_manager.shutdown()
+                logger.info("Discord SQS manager stopped successfully")
+        except Exception as e:
+            logger.error(f"Error stopping Discord SQS manager: {e}")
+        
         try:
             if hasattr(self, 'session') and self.session is not None and not self.session.closed:
                 await self.session.close()
@@ -105,12 +163,21 @@ class SCMarket(Bot):
         except Exception as e:
             logger.error(f"Error closing aiohttp session: {e}")
         
+        # Closing the journal writes out any steps still queued for it
         try:
-            if hasattr(self, 'discord_sqs_manager'):
-                await self.discord_sqs_manager.stop_consumer()
-                logger.info("Discord SQS manager stopped successfully")
+            if self.order_journal:
+                await self.order_journal.close()
         except Exception as e:
-            logger.error(f"Error stopping Discord SQS manager: {e}")
+            logger.error(f"Error closing order journal: {e}")
+        
+        if self.invite_manager:
+            await self.invite_manager.stop()
+        
+        try:
+            if self.health_server:
+                await self.health_server.stop()
+        except Exception as e:
+            logger.error(f"Error stopping health server: {e}")
         
         logger.info("Bot shutdown completed")
 
@@ -188,6 +255,10 @@ class SCMarket(Bot):
             # Use order as offer (they have similar structure)
             offer = body.get('order', {})
             
+            # Steps completed by an earlier delivery of the same order are skipped
+            entity_id = body.get('entity_id') or offer.get('order_id') or offer.get('id')
+            checkpoint = await self.get_order_journal().checkpoint(entity_id)
+            
             logger.info(f"Creating thread: server_id={server_id}, channel_id={channel_id}, members={members}")
             logger.debug(f"Offer details: {offer}")
             
@@ -196,6 +267,7 @@ class SCMarket(Bot):
                 channel_id,
                 members,
                 offer,
+                checkpoint,
             )
 
             thread = result.value
@@ -203,7 +275,10 @@ class SCMarket(Bot):
 
             # Handle invite creation
             invite = None
-            if body.get('server_id') and body.get('channel_id'):
+            if checkpoint.get('customer_invite'):
+                invite = checkpoint.get('customer_invite')
+                logger.info(f"Reusing customer invite from an earlier attempt: {invite}")
+            elif body.get('server_id') and body.get('channel_id'):
                 try:
                     invite = await self.verify_invite(
                         body.get('customer_discord_id'),
@@ -212,6 +287,8 @@ class SCMarket(Bot):
                         body.get("discord_invite")
                     )
                     logger.info(f"Invite verification result: {invite}")
+                    if invite:
+                        checkpoint.record('customer_invite', invite)
                 except Exception as e:
                     logger.error(f"Failed to verify/create invite: {e}")
                     logger.error(f"Invite details: customer_id={body.get('customer_discord_id')}, server_id={body.get('server_id')}, channel_id={body.get('channel_id')}")
@@ -242,12 +319,12 @@ class SCMarket(Bot):
         logger.info(f"Verifying invite: customer_id={customer_id}, server_id={server_id}, channel_id={channel_id}, invite_code={invite_code}")
         
         try:
-            guild: discord.Guild = await self.fetch_guild(int(server_id))
+            guild: discord.Guild = await self.get_resolver().guild(int(server_id))
             if not guild:
                 logger.debug(f"Guild not found for server_id: {server_id} - this may be a configuration issue")
                 return None
 
-            channel: discord.TextChannel = guild.get_channel(int(channel_id))
+            channel: discord.TextChannel = await self.get_resolver().channel(guild, int(channel_id))
             if not channel:
                 logger.debug(f"Channel not found for channel_id: {channel_id} in guild: {guild.name} - this may be a configuration issue")
                 return None
@@ -257,7 +334,7 @@ class SCMarket(Bot):
             # Check if customer is already a member
             try:
                 if customer_id:
-                    is_member = await guild.fetch_member(int(customer_id))
+                    is_member = await metrics.timed(guild.fetch_member(int(customer_id)), 'discord_request', operation='fetch_member')
                     if is_member:
                         logger.info(f"Customer {customer_id} is already a member of guild {guild.name}")
                         return None
@@ -268,23 +345,32 @@ class SCMarket(Bot):
 
             # Handle invite creation/verification
             try:
+                invites = self.get_invite_manager()
                 if invite_code:
+                    if invites.claim(invite_code):
+                        logger.info(f"Existing invite {invite_code} is cached and still has uses left")
+                        return invite_code
+
                     logger.debug(f"Attempting to fetch existing invite: {invite_code}")
-                    invite = await self.fetch_invite(invite_code)
+                    try:
+                        invite = await metrics.timed(self.fetch_invite(invite_code), 'discord_request', operation='fetch_invite')
+                    except discord.NotFound:
+                        invite = None
                     if invite:
                         logger.info(f"Existing invite {invite_code} is valid")
-                        return invite_code
+                        return invites.remember(invite, uses=1)
                     else:
                         logger.debug(f"Existing invite {invite_code} is invalid - this may be a configuration issue")
+                        invites.forget(invite_code)
                 else:
                     logger.debug("No existing invite code provided")
                     invite = None
 
                 if not invite:
-                    logger.info(f"Creating new invite for channel {channel.name} in guild {guild.name}")
-                    new_invite = await channel.create_invite(reason="Invite customer to the guild", unique=False)
-                    logger.info(f"Created new invite: {new_invite.code}")
-                    return new_invite.code
+                    logger.info(f"Getting invite for channel {channel.name} in guild {guild.name}")
+                    new_invite_code = await invites.get_invite(channel, reason="Invite customer to the guild")
+                    logger.info(f"Using invite: {new_invite_code}")
+                    return new_invite_code
                     
             except discord.Forbidden as e:
                 logger.debug(f"Bot lacks permission to create invites in channel {channel.name}: {e} - this is a configuration issue")
@@ -314,7 +400,7 @@ class SCMarket(Bot):
         logger.info(f"Member joined: {member.id} ({member.name}) in guild {member.guild.id} ({member.guild.name})")
         
         try:
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(json_serialize=codec.dumps) as session:
                 logger.debug(f"Fetching threads for user {member.id}")
                 
                 async with session.get(
@@ -325,7 +411,7 @@ class SCMarket(Bot):
                         return
 
                     try:
-                        result = await resp.json()
+                        result = await resp.json(loads=codec.loads)
                         logger.debug(f"Threads response for user {member.id}: {result}")
                     except Exception as e:
                         logger.error(f"Failed to decode response for user {member.id}: {e}")
@@ -381,8 +467,31 @@ class SCMarket(Bot):
             logger.error(f"Error type: {type(e).__name__}")
             logger.error(f"Full traceback: {traceback.format_exc()}")
 
-    async def create_thread(self, server_id: int, channel_id: int, members: list[int], offer: dict):
-        """Enhanced thread creation with comprehensive logging"""
+    async def add_thread_member(self, thread: discord.Thread, member, semaphore: asyncio.Semaphore) -> bool:
+        """Add one member to a thread, returning whether it succeeded"""
+        async with semaphore:
+            try:
+                logger.debug(f"Adding member {member} to thread {thread.id}")
+                await metrics.timed(thread.add_user(discord.Object(int(member))), 'discord_request', operation='add_thread_member')
+                logger.debug(f"Successfully added member {member} to thread {thread.id}")
+                return True
+            except discord.Forbidden as e:
+                logger.debug(f"Bot lacks permission to add member {member} to thread {thread.id}: {e} - this is a configuration issue")
+            except discord.NotFound as e:
+                logger.debug(f"Member {member} not found: {e} - this may be a configuration issue")
+            except discord.HTTPException as e:
+                logger.error(f"HTTP error adding member {member} to thread {thread.id}: {e}")
+            except Exception as e:
+                logger.error(f"Unexpected error adding member {member} to thread {thread.id}: {e}")
+                logger.error(f"Error type: {type(e).__name__}")
+            return False
+
+    async def create_thread(self, server_id: int, channel_id: int, members: list[int], offer: dict,
+                            checkpoint: OrderCheckpoint = None):
+        """Enhanced thread creation with comprehensive logging, resuming from the checkpoint's completed steps"""
+        if checkpoint is None:
+            checkpoint = OrderCheckpoint(None, None)
+        
         logger.info(f"Creating thread: server_id={server_id}, channel_id={channel_id}, members={members}")
         logger.debug(f"Offer details: {offer}")
         
@@ -392,7 +501,7 @@ class SCMarket(Bot):
             return Result(error=error_msg)
 
         try:
-            guild: discord.Guild = await self.fetch_guild(int(server_id))
+            guild: discord.Guild = await self.get_resolver().guild(int(server_id))
             if not guild:
                 error_msg = f"Bot is not in the configured guild: {server_id}"
                 logger.error(error_msg)
@@ -405,8 +514,8 @@ class SCMarket(Bot):
                 channel = guild.get_channel(int(channel_id))
                 if not channel:
                     try:
-                        logger.debug(f"Channel {channel_id} not in cache, fetching from Discord...")
-                        channel: discord.TextChannel = await guild.fetch_channel(int(channel_id))
+                        logger.debug(f"Channel {channel_id} not in gateway cache, resolving...")
+                        channel: discord.TextChannel = await self.get_resolver().channel(guild, int(channel_id))
                         logger.debug(f"Successfully fetched channel: {channel.name}")
                     except discord.NotFound:
                         error_msg = f"The configured thread channel {channel_id} no longer exists in guild {guild.name}"
@@ -439,18 +548,32 @@ class SCMarket(Bot):
                 logger.error(f"Full traceback: {traceback.format_exc()}")
                 return Result(error=error_msg)
 
+            # Reuse the thread created by an earlier attempt
+            thread = None
+            if checkpoint.done('thread'):
+                thread_id = int(checkpoint.get('thread'))
+                try:
+                    thread = await self.get_resolver().channel(guild, thread_id)
+                    logger.info(f"Resuming with previously created thread {thread_id}")
+                except discord.NotFound:
+                    logger.warning(f"Previously created thread {thread_id} no longer exists - starting over")
+                    checkpoint.reset()
+
             # Determine thread name
             is_order = offer.get("order_id")
             thread_name = f"{'order' if is_order else 'offer'}-{offer.get('id', offer.get('order_id'))[:8]}"
-            logger.debug(f"Creating thread with name: {thread_name}")
 
             # Create thread
             try:
-                thread = await channel.create_thread(
-                    name=thread_name,
-                    type=ChannelType.private_thread
-                )
-                logger.info(f"Successfully created thread: {thread.id} with name: {thread.name}")
+                if thread is None:
+                    logger.debug(f"Creating thread with name: {thread_name}")
+                    thread = await metrics.timed(
+                        channel.create_thread(name=thread_name, type=ChannelType.private_thread),
+                        'discord_request',
+                        operation='create_thread'
+                    )
+                    checkpoint.record('thread', str(thread.id))
+                    logger.info(f"Successfully created thread: {thread.id} with name: {thread.name}")
             except discord.Forbidden as e:
                 error_msg = f"The bot does not have permission to create threads in channel {channel.name}: {e}"
                 logger.debug(f"{error_msg} - this is a configuration issue")
@@ -467,55 +590,67 @@ class SCMarket(Bot):
                 return Result(error=error_msg)
 
             # Add bot to thread
-            try:
-                await thread.add_user(self.user)
-                logger.debug(f"Added bot to thread {thread.id}")
-            except Exception as e:
-                logger.debug(f"Failed to add bot to thread {thread.id}: {e} - this may be a configuration issue")
+            if not checkpoint.done('bot_added'):
+                try:
+                    await metrics.timed(thread.add_user(self.user), 'discord_request', operation='add_thread_member')
+                    checkpoint.record('bot_added')
+                    logger.debug(f"Added bot to thread {thread.id}")
+                except Exception as e:
+                    logger.debug(f"Failed to add bot to thread {thread.id}: {e} - this may be a configuration issue")
 
-            # Add members to thread
+            # Add members to thread, skipping those handled by an earlier attempt
             failed_members = []
-            for member in members:
+            pending = []
+            for member in dict.fromkeys(members):
                 if not member:
                     continue
 
-                try:
-                    logger.debug(f"Adding member {member} to thread {thread.id}")
-                    await thread.add_user(discord.Object(int(member)))
-                    logger.debug(f"Successfully added member {member} to thread {thread.id}")
-                except discord.Forbidden as e:
-                    logger.debug(f"Bot lacks permission to add member {member} to thread {thread.id}: {e} - this is a configuration issue")
-                    failed_members.append(member)
-                except discord.NotFound as e:
-                    logger.debug(f"Member {member} not found: {e} - this may be a configuration issue")
-                    failed_members.append(member)
-                except discord.HTTPException as e:
-                    logger.error(f"HTTP error adding member {member} to thread {thread.id}: {e}")
-                    failed_members.append(member)
-                except Exception as e:
-                    logger.error(f"Unexpected error adding member {member} to thread {thread.id}: {e}")
-                    logger.error(f"Error type: {type(e).__name__}")
+                # Only successful adds are recorded (journals from older versions may also hold 'failed'),
+                # so a redelivery retries every member that was not added
+                if checkpoint.get(f"member:{member}") == 'added':
+                    continue
+                pending.append(member)
+
+            # Adds run concurrently up to the cap; discord.py queues them on the route's rate limit bucket
+            semaphore = asyncio.Semaphore(Config.DISCORD_MEMBER_ADD_CONCURRENCY)
+            added = await asyncio.gather(*(self.add_thread_member(thread, member, semaphore) for member in pending))
+            for member, ok in zip(pending, added):
+                if ok:
+                    checkpoint.record(f"member:{member}", 'added')
+                else:
                     failed_members.append(member)
 
             # Handle failed member additions
-            invite = None
+            invite_code = None
             if failed_members:
                 logger.debug(f"Failed to add {len(failed_members)} members to thread {thread.id}: {failed_members} - these may be configuration issues")
                 
                 try:
-                    logger.info(f"Creating invite for failed members: {failed_members}")
-                    invite = await channel.create_invite(max_uses=len(failed_members))
-                    logger.info(f"Created invite: {invite.code}")
+                    invite_code = checkpoint.get('invite')
+                    if invite_code:
+                        logger.info(f"Reusing invite {invite_code} from an earlier attempt")
+                    else:
+                        logger.info(f"Getting invite for failed members: {failed_members}")
+                        invite_code = await self.get_invite_manager().get_invite(channel, uses=len(failed_members))
+                        checkpoint.record('invite', invite_code)
+                        logger.info(f"Using invite: {invite_code}")
                     
                     for member in failed_members:
+                        step = f"dm:{member}"
+                        if checkpoint.done(step):
+                            continue
+                        
                         try:
-                            user = await self.fetch_user(int(member))
-                            invite_message = f"You submitted an offer on SC Market. Please join the fulfillment server to communicate directly with the seller: {invite}"
-                            await user.send(invite_message)
+                            user = await metrics.timed(self.fetch_user(int(member)), 'discord_request', operation='fetch_user')
+                            invite_message = f"You submitted an offer on SC Market. Please join the fulfillment server to communicate directly with the seller: https://discord.gg/{invite_code}"
+                            await metrics.timed(user.send(invite_message), 'discord_request', operation='send_dm')
+                            checkpoint.record(step, 'sent')
                             logger.info(f"Sent invite message to user {member}")
                         except discord.Forbidden as e:
+                            checkpoint.record(step, 'forbidden')
                             logger.debug(f"Cannot send DM to user {member}: {e} - this is a configuration issue")
                         except discord.NotFound as e:
+                            checkpoint.record(step, 'not_found')
                             logger.debug(f"User {member} not found: {e} - this may be a configuration issue")
                         except Exception as e:
                             logger.error(f"Failed to send invite message to user {member}: {e}")
@@ -530,7 +665,7 @@ class SCMarket(Bot):
                     logger.error(f"Error type: {type(e).__name__}")
                     logger.error(f"Full traceback: {traceback.format_exc()}")
 
-            result_data = dict(thread_id=str(thread.id), failed=failed_members, invite_code=str(invite.code) if invite else None)
+            result_data = dict(thread_id=str(thread.id), failed=failed_members, invite_code=invite_code)
             logger.info(f"Thread creation completed successfully: {result_data}")
             return Result(value=result_data)
 
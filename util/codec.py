@@ -0,0 +1,129 @@
+import base64
+import binascii
+import gzip
+import json
+import logging
+import zlib
+from typing import Dict, Any, Optional, Tuple, Union
+
+from util.config import Config
+
+logger = logging.getLogger('SCMarketBot.Codec')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Message attribute naming the compression applied to an SQS body before base64; absent means uncompressed
+CONTENT_ENCODING_ATTRIBUTE = 'content_encoding'
+
+
+class DecodeError(ValueError):
+    """Malformed JSON or an SQS body that cannot be decompressed, whichever backend parsed it"""
+
+
+_BACKENDS = {'orjson': orjson, 'ujson': ujson, 'json': json}
+
+# What bad base64 and corrupt or truncated compressed data raise; decode_body reports them as DecodeError
+_CORRUPT_BODY_ERRORS = (OSError, EOFError, zlib.error, binascii.Error)
+if zstandard is not None:
+    _CORRUPT_BODY_ERRORS += (zstandard.ZstdError,)
+
+
+def _select_backend(name: str) -> str:
+    """Resolve the configured codec name to an installed backend"""
+    if name == 'auto':
+        return next(candidate for candidate in ('orjson', 'ujson', 'json') if _BACKENDS[candidate] is not None)
+    if _BACKENDS.get(name) is None:
+        logger.warning(f"JSON codec '{name}' is not available, falling back to the stdlib json module")
+        return 'json'
+    return name
+
+
+BACKEND = _select_backend(Config.JSON_CODEC)
+
+if BACKEND == 'orjson':
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    _loads = orjson.loads
+elif BACKEND == 'ujson':
+    _dumps = ujson.dumps
+    _loads = ujson.loads
+else:
+    _dumps = json.dumps
+    _loads = json.loads
+
+if Config.SQS_COMPRESSION == 'zstd' and zstandard is None:
+    logger.warning("SQS_COMPRESSION is zstd but zstandard is not installed, compressing with gzip")
+
+
+def dumps(obj: Any) -> str:
+    """Encode an object as JSON text"""
+    try:
+        return _dumps(obj)
+    except (TypeError, OverflowError):
+        # The fast backends reject integers beyond 64 bits; the stdlib encoder handles them (or raises as usual)
+        return json.dumps(obj)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Decode JSON text, raising DecodeError for malformed input"""
+    try:
+        return _loads(data)
+    except ValueError as e:
+        # Each backend raises its own ValueError subclass; callers only need to catch one type
+        raise DecodeError(str(e)) from e
+
+
+def _compress(data: bytes, encoding: str) -> Tuple[bytes, str]:
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor().compress(data), 'zstd'
+    return gzip.compress(data, compresslevel=6), 'gzip'
+
+
+def _decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise DecodeError("Received a zstd compressed message body but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise DecodeError(f"Unsupported message body content encoding: {encoding}")
+
+
+def encode_body(obj: Any, compression: Optional[str] = None) -> Tuple[str, Dict[str, str]]:
+    """Encode an SQS message body, returning it with the message attributes a receiver needs to decode it"""
+    compression = compression or Config.SQS_COMPRESSION
+    text = dumps(obj)
+    if compression == 'none' or len(text) < Config.SQS_COMPRESSION_THRESHOLD:
+        return text, {}
+
+    data = text.encode('utf-8')
+    compressed, encoding = _compress(data, compression)
+    # Base64 adds a third, so only keep the compressed form when it still comes out smaller
+    if len(compressed) * 4 // 3 + 4 < len(data):
+        return base64.b64encode(compressed).decode('ascii'), {CONTENT_ENCODING_ATTRIBUTE: encoding}
+    return text, {}
+
+
+def decode_body(raw: str, content_encoding: Optional[str] = None) -> Any:
+    """Decode an SQS message body according to its content_encoding attribute"""
+    if not content_encoding:
+        return loads(raw)
+
+    try:
+        data = _decompress(base64.b64decode(raw, validate=True), content_encoding)
+    except _CORRUPT_BODY_ERRORS as e:
+        raise DecodeError(f"Corrupt message body ({content_encoding}): {type(e).__name__}: {e}") from e
+    return loads(data)
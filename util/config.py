@@ -1,3 +1,4 @@
+import json
 import os
 from typing import Dict, Any
 
@@ -12,7 +13,26 @@ class Config:
     AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
     AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
     AWS_DEFAULT_REGION = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
-    
+
+    # SQS transport settings ('native' uses aiohttp directly, 'boto3' uses boto3 in a thread pool,
+    # 'local' uses the in-process emulator, optionally backed by the sqlite file in SQS_LOCAL_DB)
+    SQS_TRANSPORT = os.environ.get('SQS_TRANSPORT', 'native').lower()
+    SQS_LOCAL_DB = os.environ.get('SQS_LOCAL_DB')
+    SQS_ENDPOINT_URL = os.environ.get('SQS_ENDPOINT_URL')
+    SQS_HTTP_POOL_SIZE = int(os.environ.get('SQS_HTTP_POOL_SIZE', '50'))
+    # Tries per SQS request, including the first; throttling, 5xx responses and connection errors are retried
+    SQS_MAX_ATTEMPTS = int(os.environ.get('SQS_MAX_ATTEMPTS', '3'))
+    # Threads and botocore connections dedicated to the boto3 transport (0 sizes them from consumer concurrency)
+    SQS_EXECUTOR_WORKERS = int(os.environ.get('SQS_EXECUTOR_WORKERS', '0'))
+
+    # JSON codec used for SQS bodies, HTTP APIs and autocomplete values ('auto' picks orjson, then ujson,
+    # then the stdlib json module, whichever is installed)
+    JSON_CODEC = os.environ.get('JSON_CODEC', 'auto').lower()
+    # Compression of SQS bodies this bot sends ('none', 'gzip' or 'zstd'). Bodies of at least
+    # SQS_COMPRESSION_THRESHOLD bytes are compressed, base64-encoded and marked with a content_encoding attribute
+    SQS_COMPRESSION = os.environ.get('SQS_COMPRESSION', 'none').lower()
+    SQS_COMPRESSION_THRESHOLD = int(os.environ.get('SQS_COMPRESSION_THRESHOLD', '4096'))
+
     # SQS Queue URLs (from deployed CDK stack)
     DISCORD_QUEUE_URL = os.environ.get('DISCORD_QUEUE_URL', 'https://sqs.us-east-2.amazonaws.com/272095582125/DiscordQueuesStack-discord-queue')
     BACKEND_QUEUE_URL = os.environ.get('BACKEND_QUEUE_URL', 'https://sqs.us-east-2.amazonaws.com/272095582125/DiscordQueuesStack-backend-queue')
@@ -28,9 +48,89 @@ class Config:
     SQS_CONSUMER_SETTINGS = {
         'max_messages': int(os.environ.get('SQS_MAX_MESSAGES', '10')),
         'wait_time': int(os.environ.get('SQS_WAIT_TIME', '20')),
-        'retry_delay': int(os.environ.get('SQS_RETRY_DELAY', '5'))
+        'retry_delay': int(os.environ.get('SQS_RETRY_DELAY', '5')),
+        'delete_batch_size': int(os.environ.get('SQS_DELETE_BATCH_SIZE', '10')),
+        'delete_flush_interval': float(os.environ.get('SQS_DELETE_FLUSH_INTERVAL', '0.5')),
+        'send_batch_size': int(os.environ.get('SQS_SEND_BATCH_SIZE', '10')),
+        'send_linger': float(os.environ.get('SQS_SEND_LINGER', '0.05')),
+        'workers': int(os.environ.get('SQS_WORKERS', '10')),
+        'buffer_size': int(os.environ.get('SQS_BUFFER_SIZE', '10')),
+        'pollers': int(os.environ.get('SQS_POLLERS', '1')),
+        'heartbeat_interval': float(os.environ.get('SQS_HEARTBEAT_INTERVAL', '10')),
+        'visibility_extension': int(os.environ.get('SQS_VISIBILITY_EXTENSION', '30')),
+        'max_message_lifetime': float(os.environ.get('SQS_MAX_MESSAGE_LIFETIME', '300')),
+        'metrics_sample_interval': float(os.environ.get('SQS_METRICS_SAMPLE_INTERVAL', '15')),
+        # Receives after which a message that keeps failing is quarantined (0 leaves it to the queue's redrive policy)
+        'max_receive_count': int(os.environ.get('SQS_MAX_RECEIVE_COUNT', '5')),
+        # Adaptive polling tunes each receive's batch size and wait time within max_messages/wait_time
+        'adaptive_polling': os.environ.get('SQS_ADAPTIVE_POLLING', 'true').lower() == 'true',
+        'min_wait_time': int(os.environ.get('SQS_MIN_WAIT_TIME', '1')),
+        # How long a stopping consumer lets in-flight handlers finish before abandoning them
+        'drain_timeout': float(os.environ.get('SQS_DRAIN_TIMEOUT', '30'))
+    }
+    
+    # Messages that can never succeed (undecodable, unknown type, failed validation) and messages that keep
+    # failing past max_receive_count go to the dead-letter queue when one is configured, otherwise to the
+    # local sqlite quarantine store
+    SQS_DEAD_LETTER_QUEUE_URL = os.environ.get('SQS_DEAD_LETTER_QUEUE_URL')
+    SQS_QUARANTINE_DB = os.environ.get('SQS_QUARANTINE_DB', 'data/quarantine.db')
+    
+    # Responses already produced for processed messages, so redeliveries are answered without touching
+    # Discord again (the TTL should cover the queue's message retention period; an empty DB path keeps it in memory)
+    IDEMPOTENCY_SETTINGS = {
+        'max_entries': int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '10000')),
+        'ttl': float(os.environ.get('IDEMPOTENCY_TTL', '345600')),
+        'db_path': os.environ.get('IDEMPOTENCY_DB', 'data/idempotency.db')
+    }
+    
+    # Completed order_placed steps per order, so a retried delivery resumes instead of starting over
+    ORDER_JOURNAL_SETTINGS = {
+        'db_path': os.environ.get('ORDER_JOURNAL_DB', 'data/order_journal.db'),
+        'ttl': float(os.environ.get('ORDER_JOURNAL_TTL', '345600')),
+        # Expired entries are deleted by a periodic sweep rather than on every order
+        'sweep_interval': float(os.environ.get('ORDER_JOURNAL_SWEEP_INTERVAL', '3600'))
     }
     
+    # SQS autoscaling settings (pollers and workers follow queue depth within these bounds)
+    SQS_AUTOSCALE_SETTINGS = {
+        'enabled': os.environ.get('SQS_AUTOSCALE', 'true').lower() == 'true',
+        'min_pollers': int(os.environ.get('SQS_AUTOSCALE_MIN_POLLERS', '1')),
+        'max_pollers': int(os.environ.get('SQS_AUTOSCALE_MAX_POLLERS', '5')),
+        'min_workers': int(os.environ.get('SQS_AUTOSCALE_MIN_WORKERS', '5')),
+        'max_workers': int(os.environ.get('SQS_AUTOSCALE_MAX_WORKERS', '50')),
+        'interval': float(os.environ.get('SQS_AUTOSCALE_INTERVAL', '15')),
+        'target_drain_seconds': float(os.environ.get('SQS_AUTOSCALE_TARGET_DRAIN_SECONDS', '120')),
+        'scale_down_cooldown': int(os.environ.get('SQS_AUTOSCALE_SCALE_DOWN_COOLDOWN', '4'))
+    }
+    
+    # Discord queue lanes: message types grouped by priority (lower runs first) with a concurrency cap each.
+    # Types without a lane use 'default'. All lanes share DISCORD_QUEUE_CONCURRENCY handler slots.
+    DISCORD_QUEUE_LANES = json.loads(os.environ['DISCORD_QUEUE_LANES']) if os.environ.get('DISCORD_QUEUE_LANES') else {
+        'threads': {'types': ['create_thread'], 'priority': 0, 'concurrency': int(os.environ.get('DISCORD_THREAD_LANE_CONCURRENCY', '20'))},
+        'default': {'types': [], 'priority': 10, 'concurrency': int(os.environ.get('DISCORD_DEFAULT_LANE_CONCURRENCY', '2'))}
+    }
+    DISCORD_QUEUE_CONCURRENCY = int(os.environ.get('DISCORD_QUEUE_CONCURRENCY', '20'))
+    
+    # Seconds a guild or channel fetched over REST is reused before fetching again (gateway-cached ones never expire)
+    DISCORD_RESOLVE_CACHE_TTL = float(os.environ.get('DISCORD_RESOLVE_CACHE_TTL', '300'))
+    # Members added to a new thread at once (discord.py still paces the requests to Discord's rate limits)
+    DISCORD_MEMBER_ADD_CONCURRENCY = int(os.environ.get('DISCORD_MEMBER_ADD_CONCURRENCY', '5'))
+    
+    # Invites to fulfillment channels are reused across orders. max_age/max_uses apply to invites the bot
+    # creates (max_age 0 = never expires; max_uses 0 = only the joins the order needs, never unlimited);
+    # invites expiring within min_remaining seconds are not handed out
+    DISCORD_INVITE_SETTINGS = {
+        'max_age': int(os.environ.get('DISCORD_INVITE_MAX_AGE', '86400')),
+        'max_uses': int(os.environ.get('DISCORD_INVITE_MAX_USES', '0')),
+        'min_remaining': float(os.environ.get('DISCORD_INVITE_MIN_REMAINING', '3600')),
+        'sweep_interval': float(os.environ.get('DISCORD_INVITE_SWEEP_INTERVAL', '600'))
+    }
+    
+    # Embedded HTTP server for /live, /ready and /metrics (orchestrator probes and metric scrapes)
+    HEALTH_SERVER_ENABLED = os.environ.get('HEALTH_SERVER_ENABLED', 'true').lower() == 'true'
+    HEALTH_SERVER_HOST = os.environ.get('HEALTH_SERVER_HOST', '0.0.0.0')
+    HEALTH_SERVER_PORT = int(os.environ.get('HEALTH_SERVER_PORT', '8000'))
+    
     # Feature flags
     ENABLE_SQS = os.environ.get('ENABLE_SQS', 'true').lower() == 'true'
     ENABLE_DISCORD_QUEUE = os.environ.get('ENABLE_DISCORD_QUEUE', 'true').lower() == 'true'
@@ -43,7 +143,7 @@ class Config:
         if not cls.DISCORD_API_KEY:
             issues['DISCORD_API_KEY'] = 'Discord API key is required'
         
-        if cls.ENABLE_SQS:
+        if cls.ENABLE_SQS and cls.SQS_TRANSPORT != 'local':
             if not cls.AWS_ACCESS_KEY_ID or not cls.AWS_SECRET_ACCESS_KEY:
                 issues['AWS_CREDENTIALS'] = 'AWS credentials are required when SQS is enabled'
         
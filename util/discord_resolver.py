@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+
+import discord
+
+from util.metrics import metrics
+
+logger = logging.getLogger('SCMarketBot.DiscordResolver')
+
+
+class DiscordResolver:
+    """Resolves guilds and channels from the gateway cache first, falling back to REST with a TTL cache"""
+
+    def __init__(self, bot, ttl: float = 300):
+        self.bot = bot
+        self.ttl = ttl
+        self._guilds: Dict[int, Tuple[float, discord.Guild]] = {}
+        # channel id -> (expiry, channel, guild id) so a guild removal can drop its channels too
+        self._channels: Dict[int, Tuple[float, Any, int]] = {}
+        # REST fetches in flight, shared by concurrent lookups of the same id
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+
+        # Discord tells us when these change, so stale entries are dropped rather than waiting out the TTL
+        bot.add_listener(self.on_guild_update, 'on_guild_update')
+        bot.add_listener(self.on_guild_remove, 'on_guild_remove')
+        bot.add_listener(self.on_guild_remove, 'on_guild_unavailable')
+        bot.add_listener(self.on_channel_update, 'on_guild_channel_update')
+        bot.add_listener(self.on_channel_delete, 'on_guild_channel_delete')
+        bot.add_listener(self.on_channel_update, 'on_thread_update')
+        bot.add_listener(self.on_channel_delete, 'on_thread_delete')
+        bot.add_listener(self.on_raw_thread_delete, 'on_raw_thread_delete')
+
+    def _cached(self, cache: Dict[int, Tuple], key: int) -> Optional[Tuple]:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del cache[key]
+            return None
+        return entry
+
+    async def _fetch_once(self, key: Tuple[str, int], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run one REST fetch per key at a time; callers arriving meanwhile await the same result"""
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.counter('discord_resolve_total', kind=key[0], source='inflight').inc()
+        else:
+            metrics.counter('discord_resolve_total', kind=key[0], source='rest').inc()
+            task = self._inflight[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller being cancelled does not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def guild(self, guild_id: int) -> discord.Guild:
+        """Resolve a guild, raising the REST error (NotFound, Forbidden, ...) if it cannot be fetched"""
+        guild_id = int(guild_id)
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None:
+            metrics.counter('discord_resolve_total', kind='guild', source='gateway').inc()
+            return guild
+
+        entry = self._cached(self._guilds, guild_id)
+        if entry is not None:
+            metrics.counter('discord_resolve_total', kind='guild', source='cache').inc()
+            return entry[1]
+
+        return await self._fetch_once(('guild', guild_id), lambda: self._fetch_guild(guild_id))
+
+    async def _fetch_guild(self, guild_id: int) -> discord.Guild:
+        guild = await metrics.timed(self.bot.fetch_guild(guild_id), 'discord_request', operation='fetch_guild')
+        if guild is not None:
+            self._guilds[guild_id] = (time.monotonic() + self.ttl, guild)
+        return guild
+
+    async def channel(self, guild: discord.Guild, channel_id: int):
+        """Resolve a channel or thread within a guild, raising the REST error if it cannot be fetched"""
+        channel_id = int(channel_id)
+        channel = guild.get_channel(channel_id) or guild.get_thread(channel_id)
+        if channel is not None:
+            metrics.counter('discord_resolve_total', kind='channel', source='gateway').inc()
+            return channel
+
+        entry = self._cached(self._channels, channel_id)
+        if entry is not None:
+            metrics.counter('discord_resolve_total', kind='channel', source='cache').inc()
+            return entry[1]
+
+        return await self._fetch_once(('channel', channel_id), lambda: self._fetch_channel(guild, channel_id))
+
+    async def _fetch_channel(self, guild: discord.Guild, channel_id: int):
+        channel = await metrics.timed(guild.fetch_channel(channel_id), 'discord_request', operation='fetch_channel')
+        if channel is not None:
+            self._channels[channel_id] = (time.monotonic() + self.ttl, channel, guild.id)
+        return channel
+
+    def invalidate_guild(self, guild_id: int):
+        """Forget a guild and every channel cached for it"""
+        self._guilds.pop(guild_id, None)
+        for channel_id in [cid for cid, entry in self._channels.items() if entry[2] == guild_id]:
+            del self._channels[channel_id]
+
+    def invalidate_channel(self, channel_id: int):
+        self._channels.pop(channel_id, None)
+
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        self.invalidate_guild(after.id)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        logger.debug(f"Dropping cached guild {guild.id} and its channels")
+        self.invalidate_guild(guild.id)
+
+    async def on_channel_update(self, before, after):
+        self.invalidate_channel(after.id)
+
+    async def on_channel_delete(self, channel):
+        self.invalidate_channel(channel.id)
+
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent):
+        self.invalidate_channel(payload.thread_id)
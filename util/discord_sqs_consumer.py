@@ -1,47 +1,115 @@
 import asyncio
-import json
+import contextlib
 import logging
 import traceback
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Mapping, Optional
 from datetime import datetime
 
 from util.config import Config
+from util.idempotency import IdempotencyStore
+from util.priority_lanes import MessageLane, PriorityLimiter
+from util.sqs_message import LazyMessageBody, MessageDecodeError, PermanentMessageError, string_attributes
 
 logger = logging.getLogger('SCMarketBot.DiscordSQSConsumer')
 
 class DiscordSQSMessage:
-    """Represents a message from the Discord queue"""
-    
-    def __init__(self, message_data: Dict[str, Any]):
-        self.type = message_data.get('type')
-        self.payload = message_data.get('payload', {})
-        self.metadata = message_data.get('metadata', {})
-        self.order_id = self.metadata.get('order_id')
-        self.entity_type = self.metadata.get('entity_type')
-        self.created_at = self.metadata.get('created_at')
-        self.retry_count = self.metadata.get('retry_count', 0)
-        
-        # Extract entity info for easier access
-        self.entity_info = self.payload.get('entity_info', {})
-        self.entity_id = self.entity_info.get('id')
-        self.entity_type_from_payload = self.entity_info.get('type')
-        
+    """Represents a message from the Discord queue; routing fields come from message attributes when present,
+    so the body is only decoded for fields the attributes do not carry"""
+    
+    def __init__(self, message_data: Mapping[str, Any], message_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, str]] = None):
+        self.message_id = message_id
+        self.message_data = message_data
+        self.attributes = attributes or {}
+    
+    @property
+    def type(self) -> Optional[str]:
+        return self.attributes.get('type') or self.message_data.get('type')
+    
+    @property
+    def payload(self) -> Dict[str, Any]:
+        return self.message_data.get('payload', {})
+    
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.message_data.get('metadata', {})
+    
+    @property
+    def order_id(self) -> Optional[str]:
+        return self.metadata.get('order_id')
+    
+    @property
+    def entity_type(self) -> Optional[str]:
+        return self.metadata.get('entity_type')
+    
+    @property
+    def created_at(self):
+        return self.metadata.get('created_at')
+    
+    @property
+    def retry_count(self) -> int:
+        return self.metadata.get('retry_count', 0)
+    
+    @property
+    def entity_info(self) -> Dict[str, Any]:
+        return self.payload.get('entity_info', {})
+    
+    @property
+    def entity_id(self) -> Optional[str]:
+        return self.attributes.get('entity_id') or self.entity_info.get('id')
+    
+    @property
+    def entity_type_from_payload(self) -> Optional[str]:
+        return self.entity_info.get('type')
+    
+    @property
+    def server_id(self) -> Optional[str]:
+        return self.attributes.get('server_id') or self.payload.get('server_id')
+    
+    def log_correlation(self):
+        """Log the IDs used for correlation and warn when they are missing or inconsistent (decodes the body)"""
         # CRITICAL: Log the extracted IDs for debugging
-        logger.info(f"DiscordSQSMessage initialized: type={self.type}, order_id={self.order_id}, entity_id={self.entity_id}, entity_type={self.entity_type}")
+        logger.info(f"DiscordSQSMessage: type={self.type}, order_id={self.order_id}, entity_id={self.entity_id}, entity_type={self.entity_type}")
         
         # Validate that we have the necessary ID for correlation
         if not self.entity_id and not self.order_id:
-            logger.warning(f"Message missing both entity_id and order_id - correlation may fail: {message_data}")
+            logger.warning(f"Message missing both entity_id and order_id - correlation may fail: {self.message_data}")
         elif self.entity_id and self.order_id and self.entity_id != self.order_id:
             logger.warning(f"Message has different entity_id ({self.entity_id}) and order_id ({self.order_id}) - using entity_id for correlation")
+    
+    @property
+    def business_entity_id(self) -> Optional[str]:
+        """The business entity ID used for correlation (entity_id from payload, then order_id from metadata)"""
+        return self.entity_id or self.order_id
+    
+    def idempotency_keys(self) -> List[str]:
+        """Keys identifying this delivery and the business entity it is about"""
+        keys = []
+        if self.business_entity_id:
+            keys.append(f"{self.type}:entity:{self.business_entity_id}")
+        if self.message_id:
+            keys.append(f"{self.type}:message:{self.message_id}")
+        return keys
 
 class DiscordSQSResponse:
     """Represents a response to send back to the backend"""
     
-    def __init__(self, message_type: str, payload: Dict[str, Any], metadata: Dict[str, Any]):
+    def __init__(self, message_type: str, payload: Dict[str, Any], metadata: Dict[str, Any],
+                 server_id: Optional[str] = None):
         self.type = message_type
         self.payload = payload
         self.metadata = metadata
+        self.server_id = server_id
+    
+    def message_attributes(self) -> Dict[str, str]:
+        """Routing attributes sent alongside the body so the backend can route without decoding it"""
+        entity_id = self.metadata.get('entity_id') or self.metadata.get('original_order_id')
+        attributes = {
+            'type': self.type,
+            'entity_id': entity_id if entity_id != 'unknown' else None,
+            'server_id': self.server_id
+        }
+        return {name: str(value) for name, value in attributes.items() if value}
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -63,6 +131,60 @@ class DiscordSQSConsumer:
             'create_thread': self._handle_create_thread,
             # Add more handlers as needed
         }
+        
+        settings = Config.IDEMPOTENCY_SETTINGS
+        self.idempotency = IdempotencyStore(settings['max_entries'], settings['ttl'], settings['db_path'] or None)
+        self._key_locks = {}
+        
+        # Lanes keep bursts of low-value message types from delaying thread creation
+        self.lanes = {
+            name: MessageLane(name, lane['priority'], lane['concurrency'])
+            for name, lane in Config.DISCORD_QUEUE_LANES.items()
+        }
+        self.lanes.setdefault('default', MessageLane('default', 10, 1))
+        self.lane_by_type = {
+            message_type: self.lanes[name]
+            for name, lane in Config.DISCORD_QUEUE_LANES.items()
+            for message_type in lane.get('types', [])
+        }
+        self.discord_limiter = PriorityLimiter(Config.DISCORD_QUEUE_CONCURRENCY)
+    
+    def _lane_for(self, message_type: Optional[str]) -> MessageLane:
+        """Get the lane a message type is processed in"""
+        return self.lane_by_type.get(message_type, self.lanes['default'])
+    
+    def message_priority(self, raw_message: Dict[str, Any], body: Optional[LazyMessageBody] = None) -> int:
+        """Priority of a received message, used to order the consumer's buffer"""
+        message_type = string_attributes(raw_message).get('type')
+        if message_type is None:
+            try:
+                # Without a type attribute the body has to be read; the pipeline hands this same (now decoded)
+                # body to the worker, so it is decoded only once
+                if body is None:
+                    body = LazyMessageBody.for_message(raw_message)
+                message_type = body.get('type')
+            except Exception as e:
+                # This runs in the poller, so an unreadable body must not take the rest of the batch down with it.
+                # The message goes to the default lane and fails (and is quarantined) in its worker instead
+                logger.debug(f"Could not read type of message {raw_message.get('MessageId', 'unknown')}: {e}")
+        return self._lane_for(message_type).priority
+    
+    def get_lane_status(self) -> Dict[str, Any]:
+        """Per-lane concurrency and throughput"""
+        return {name: lane.get_status() for name, lane in self.lanes.items()}
+    
+    @contextlib.asynccontextmanager
+    async def _exclusive(self, key: str):
+        """Serialize concurrent deliveries that share an idempotency key"""
+        entry = self._key_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._key_locks[key]
     
     async def process_message(self, message_body: Dict[str, Any], raw_message: Dict[str, Any]) -> bool:
         """Process an incoming Discord queue message"""
@@ -71,39 +193,48 @@ class DiscordSQSConsumer:
         
         logger.info(f"Processing message {message_id} from Discord queue")
         logger.debug(f"Raw message: {raw_message}")
-        logger.debug(f"Message body: {message_body}")
         
         try:
-            discord_message = DiscordSQSMessage(message_body)
-            logger.info(f"Processing {discord_message.type} message for order {discord_message.order_id}")
+            discord_message = DiscordSQSMessage(message_body, message_id, string_attributes(raw_message))
             
-            if discord_message.type in self.message_handlers:
-                handler = self.message_handlers[discord_message.type]
-                logger.debug(f"Calling handler for {discord_message.type}")
-                
-                start_time = asyncio.get_event_loop().time()
-                result = await handler(discord_message)
-                processing_time = asyncio.get_event_loop().time() - start_time
-                
-                if result:
-                    logger.info(f"Successfully processed {discord_message.type} message in {processing_time:.2f}s")
-                else:
-                    logger.error(f"Failed to process {discord_message.type} message in {processing_time:.2f}s")
-                
-                return result
-            else:
+            # With a type attribute, unknown types are rejected without decoding the body
+            if discord_message.type not in self.message_handlers:
                 logger.warning(f"Unknown message type: {discord_message.type} - this may be a configuration issue")
                 logger.debug(f"Available handlers: {list(self.message_handlers.keys())}")
-                return False
+                raise PermanentMessageError(f"Unknown message type: {discord_message.type}")
+            
+            logger.info(f"Processing {discord_message.type} message for entity {discord_message.business_entity_id}")
+            handler = self.message_handlers[discord_message.type]
+            lane = self._lane_for(discord_message.type)
+            logger.debug(f"Calling handler for {discord_message.type} in lane {lane.name}")
+            
+            start_time = asyncio.get_event_loop().time()
+            async with lane.slot(self.discord_limiter):
+                result = await handler(discord_message)
+            processing_time = asyncio.get_event_loop().time() - start_time
+            
+            if result:
+                logger.info(f"Successfully processed {discord_message.type} message in {processing_time:.2f}s")
+            else:
+                logger.error(f"Failed to process {discord_message.type} message in {processing_time:.2f}s")
+            
+            return result
                 
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error processing message {message_id}: {e}")
+        except MessageDecodeError as e:
+            # Raised when a handler first touches an undecodable body; the consumer quarantines the message
+            logger.error(f"Body decode error processing message {message_id}: {e}")
             logger.error(f"Message body that failed to decode: {message_body}")
+            raise
+        except PermanentMessageError:
+            raise
+        except ValueError as e:
+            logger.error(f"Invalid value processing message {message_id}: {e}")
+            logger.error(f"Message body: {message_body}")
             return False
         except KeyError as e:
             logger.error(f"Missing required field in message {message_id}: {e}")
             logger.error(f"Message body: {message_body}")
-            return False
+            raise PermanentMessageError(f"Missing required field: {e}") from e
         except Exception as e:
             logger.error(f"Unexpected error processing Discord queue message {message_id}: {e}")
             logger.error(f"Error type: {type(e).__name__}")
@@ -112,8 +243,26 @@ class DiscordSQSConsumer:
             return False
     
     async def _handle_create_thread(self, message: DiscordSQSMessage) -> bool:
-        """Handle create_thread message type"""
+        """Handle create_thread message type, replaying the stored response for repeat deliveries"""
+        keys = message.idempotency_keys()
+        if not keys:
+            return await self._create_thread(message)
+        
+        async with self._exclusive(keys[0]):
+            previous = self.idempotency.get(keys)
+            if previous is not None:
+                logger.info(f"Duplicate create_thread delivery for {message.business_entity_id} (message {message.message_id}) - "
+                            f"resending thread_created for thread {previous['payload'].get('thread_id')}")
+                response = DiscordSQSResponse('thread_created', previous['payload'], previous['metadata'],
+                                              previous.get('server_id'))
+                return await self._send_response(response)
+            
+            return await self._create_thread(message)
+    
+    async def _create_thread(self, message: DiscordSQSMessage) -> bool:
+        """Create the thread requested by a create_thread message and report the outcome"""
         try:
+            message.log_correlation()
             payload = message.payload
             logger.info(f"Processing create_thread payload: {payload}")
             
@@ -141,7 +290,7 @@ class DiscordSQSConsumer:
                 logger.error(error_msg)
                 logger.error(f"Payload: {payload}")
                 await self._send_error_response(message, error_msg)
-                return False
+                raise PermanentMessageError(error_msg)
             
             # Validate data types
             try:
@@ -154,7 +303,7 @@ class DiscordSQSConsumer:
                 logger.error(error_msg)
                 logger.error(f"Raw values: server_id={server_id}, channel_id={channel_id}, members={members}")
                 await self._send_error_response(message, error_msg)
-                return False
+                raise PermanentMessageError(error_msg) from e
             
             # Create the thread using existing bot method
             logger.info(f"Calling bot.order_placed with data: {{'server_id': {server_id}, 'channel_id': {channel_id}, 'members': {members}, 'order': {order}, 'customer_discord_id': {customer_discord_id}}}")
@@ -165,7 +314,8 @@ class DiscordSQSConsumer:
                 'channel_id': channel_id,
                 'members': members,
                 'order': order,
-                'customer_discord_id': customer_discord_id
+                'customer_discord_id': customer_discord_id,
+                'entity_id': message.business_entity_id  # Keys the step journal so retries resume
             })
             processing_time = asyncio.get_event_loop().time() - start_time
             
@@ -191,10 +341,21 @@ class DiscordSQSConsumer:
                         'original_order_id': business_entity_id,  # ← FIXED: Use business entity ID, not thread ID
                         'entity_type': entity_type,  # Include entity_type for backend correlation
                         'entity_id': entity_id  # Include entity_id for backend correlation
-                    }
+                    },
+                    server_id
                 )
                 
-                await self._send_response(response)
+                # Remember the outcome before responding so a redelivery never creates a second thread
+                self.idempotency.put(message.idempotency_keys(), {
+                    'payload': response.payload,
+                    'metadata': response.metadata,
+                    'server_id': response.server_id
+                })
+                
+                if not await self._send_response(response):
+                    # Leave the message on the queue; its redelivery resends the stored response
+                    logger.error(f"Thread {new_thread_id} created but thread_created was not sent - retrying")
+                    return False
                 logger.info(f"Thread created successfully: {new_thread_id}")
                 return True
             else:
@@ -205,6 +366,9 @@ class DiscordSQSConsumer:
                 await self._send_error_response(message, error_msg)
                 return False
                 
+        except PermanentMessageError:
+            # Validation failures were reported to the backend above; an undecodable body cannot be answered
+            raise
         except Exception as e:
             logger.error(f"Unexpected error handling create_thread: {e}")
             logger.error(f"Error type: {type(e).__name__}")
@@ -214,11 +378,12 @@ class DiscordSQSConsumer:
             return False
     
     async def _send_response(self, response: DiscordSQSResponse) -> bool:
-        """Send a response to the backend queue"""
+        """Send a response to the backend queue, coalesced with other responses into batch sends"""
         try:
-            success = await self.sqs_client.send_message(
-                Config.BACKEND_QUEUE_URL.split('/')[-1],  # Extract queue name from URL
-                response.to_dict()
+            success = await self.sqs_client.send_message_batched(
+                Config.BACKEND_QUEUE_URL,  # Full URL, so no GetQueueUrl round trip is needed
+                response.to_dict(),
+                response.message_attributes()
             )
             
             if success:
@@ -255,7 +420,8 @@ class DiscordSQSConsumer:
                     'original_type': original_message.type,
                     'entity_type': entity_type,  # Include entity_type for backend correlation
                     'entity_id': entity_id  # Include entity_id for backend correlation
-                }
+                },
+                original_message.server_id
             )
             
             return await self._send_response(response)
@@ -273,6 +439,8 @@ class DiscordSQSManager:
         self.consumer = None
         self.consumer_task = None
         self.health_task = None
+        self.autoscaler = None
+        self.autoscaler_task = None
         self.restart_count = 0
         self.last_restart_time = 0
         self.consumer_start_time = 0
@@ -302,8 +470,8 @@ class DiscordSQSManager:
             return
         
         try:
-            # Extract queue name from URL
-            queue_name = Config.DISCORD_QUEUE_URL.split('/')[-1]
+            # The SQS client accepts the full queue URL directly
+            queue_name = Config.DISCORD_QUEUE_URL
             
             # Start consumer with enhanced monitoring
             self.consumer_task = asyncio.create_task(
@@ -313,6 +481,12 @@ class DiscordSQSManager:
             # Start health monitoring
             self.health_task = asyncio.create_task(self._comprehensive_health_monitor(queue_name))
             
+            # Scale pollers and workers with queue depth
+            if Config.SQS_AUTOSCALE_SETTINGS['enabled']:
+                from util.sqs_autoscaler import SQSAutoscaler
+                self.autoscaler = SQSAutoscaler(self.sqs_client, queue_name, Config.SQS_AUTOSCALE_SETTINGS)
+                self.autoscaler_task = asyncio.create_task(self.autoscaler.run())
+            
             self.consumer_start_time = asyncio.get_event_loop().time()
             logger.info(f"Started Discord SQS consumer for queue: {queue_name}")
             
@@ -328,7 +502,8 @@ class DiscordSQSManager:
                 queue_name,
                 self.consumer.process_message,
                 Config.SQS_CONSUMER_SETTINGS['max_messages'],
-                Config.SQS_CONSUMER_SETTINGS['wait_time']
+                Config.SQS_CONSUMER_SETTINGS['wait_time'],
+                message_priority=self.consumer.message_priority
             )
             
         except asyncio.CancelledError:
@@ -405,8 +580,8 @@ class DiscordSQSManager:
                 # Get SQS client health
                 sqs_health = self.sqs_client.get_health_status() if self.sqs_client else {}
                 
-                # Get queue attributes
-                queue_attributes = await self.sqs_client.get_queue_attributes(queue_name) if self.sqs_client else {}
+                # Read queue metrics from the shared sampler
+                queue_metrics = await self.sqs_client.get_queue_metrics(queue_name) if self.sqs_client else {}
                 
                 # Log comprehensive health status
                 logger.info(f"Consumer health check - Queue: {queue_name}")
@@ -421,10 +596,8 @@ class DiscordSQSManager:
                     logger.info(f"  Total messages: {sqs_health.get('message_count', 0)}")
                     logger.info(f"  Error count: {sqs_health.get('error_count', 0)}")
                 
-                if queue_attributes:
-                    depth = int(queue_attributes.get('ApproximateNumberOfMessages', 0))
-                    in_flight = int(queue_attributes.get('ApproximateNumberOfMessagesNotVisible', 0))
-                    logger.info(f"  Queue depth: {depth}, In flight: {in_flight}")
+                if queue_metrics:
+                    logger.info(f"  Queue depth: {queue_metrics['depth']}, In flight: {queue_metrics['in_flight']}")
                 
                 # Check for unhealthy conditions
                 if not consumer_healthy:
@@ -440,8 +613,8 @@ class DiscordSQSManager:
                     logger.warning(f"Queue {queue_name} has high error count: {sqs_health['error_count']}")
                 
                 # Check for high queue depth
-                if queue_attributes and int(queue_attributes.get('ApproximateNumberOfMessages', 0)) > 100:
-                    logger.warning(f"Queue {queue_name} has high depth: {queue_attributes['ApproximateNumberOfMessages']} messages")
+                if queue_metrics and queue_metrics['depth'] > 100:
+                    logger.warning(f"Queue {queue_name} has high depth: {queue_metrics['depth']} messages")
                 
             except asyncio.CancelledError:
                 break
@@ -449,10 +622,19 @@ class DiscordSQSManager:
                 logger.error(f"Health monitor error: {e}")
                 await asyncio.sleep(30)  # Wait before retrying
     
-    async def stop_consumer(self):
-        """Stop the Discord SQS consumer"""
+    async def stop_consumer(self, drain: bool = True):
+        """Stop the Discord SQS consumer, draining in-flight work first unless drain is False"""
         logger.info("Stopping Discord SQS consumer...")
         
+        # Stop autoscaling before tearing down the pipeline it resizes
+        if self.autoscaler_task and not self.autoscaler_task.done():
+            self.autoscaler_task.cancel()
+            try:
+                await self.autoscaler_task
+            except asyncio.CancelledError:
+                pass
+        self.autoscaler_task = None
+        
         # Cancel health monitoring
         if self.health_task and not self.health_task.done():
             self.health_task.cancel()
@@ -462,6 +644,19 @@ class DiscordSQSManager:
                 pass
             self.health_task = None
         
+        # Finish in-flight messages, release unstarted ones and flush acks and responses
+        if drain and self.sqs_client and self.consumer_task and not self.consumer_task.done():
+            summary = await self.sqs_client.drain_consumer(
+                Config.DISCORD_QUEUE_URL,
+                Config.SQS_CONSUMER_SETTINGS['drain_timeout']
+            )
+            if summary is not None:
+                # The pipeline has stopped, so the consumer task winds down by itself
+                try:
+                    await asyncio.wait_for(asyncio.shield(self.consumer_task), timeout=10)
+                except asyncio.TimeoutError:
+                    logger.warning("Consumer task did not finish after draining - cancelling it")
+        
         # Cancel consumer task
         if self.consumer_task and not self.consumer_task.done():
             self.consumer_task.cancel()
@@ -471,8 +666,22 @@ class DiscordSQSManager:
                 pass
         
         self.consumer_task = None
+        
+        # Stop sampling queue attributes last: the autoscaler and both health monitors restart it when they read
+        if self.sqs_client:
+            await self.sqs_client.stop_queue_sampler(Config.DISCORD_QUEUE_URL)
         logger.info("Stopped Discord SQS consumer")
     
+    async def shutdown(self):
+        """Stop the consumer and release the SQS client's connections"""
+        await self.stop_consumer()
+        
+        if self.sqs_client:
+            await self.sqs_client.close()
+        
+        if self.consumer:
+            await self.consumer.idempotency.close()
+    
     def get_health_status(self) -> Dict[str, Any]:
         """Get comprehensive health status of the SQS manager"""
         current_time = asyncio.get_event_loop().time()
@@ -490,6 +699,12 @@ class DiscordSQSManager:
                 not self.health_task.done() and 
                 not self.health_task.cancelled()
             ),
+            'autoscaler_running': (
+                self.autoscaler_task is not None and 
+                not self.autoscaler_task.done()
+            ),
+            'autoscaler_decision': self.autoscaler.last_decision if self.autoscaler else None,
+            'lanes': self.consumer.get_lane_status() if self.consumer else None,
             'uptime': current_time - self.consumer_start_time if self.consumer_start_time else 0,
             'restart_count': self.restart_count,
             'last_restart': self.last_restart_time,
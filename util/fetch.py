@@ -1,18 +1,31 @@
 import aiohttp
+import asyncio
 import logging
+import time
 import traceback
 from typing import Optional, Dict, Any
 
 from cogs.registration import DISCORD_BACKEND_URL
+from util import codec
+from util.metrics import metrics
 
 logger = logging.getLogger('SCMarketBot.Fetch')
 
-async def public_fetch(url, params=None, session=None):
+
+def _record_request(api: str, method: str, endpoint: str, status: str, start: float):
+    """Record one backend API call's latency and outcome, labelled by endpoint"""
+    labels = dict(api=api, method=method, endpoint=endpoint)
+    metrics.histogram('http_request_seconds', **labels).observe(time.perf_counter() - start)
+    metrics.counter('http_requests_total', status=status, **labels).inc()
+
+async def public_fetch(url, params=None, session=None, endpoint=None):
     """Enhanced public fetch with comprehensive error logging"""
     tempsession = None
+    status = 'error'
+    start = time.perf_counter()
     try:
         if session is None:
-            tempsession = aiohttp.ClientSession()
+            tempsession = aiohttp.ClientSession(json_serialize=codec.dumps)
             logger.debug(f"Created temporary session for public fetch to {url}")
         else:
             tempsession = session
@@ -23,11 +36,12 @@ async def public_fetch(url, params=None, session=None):
                 f"https://api.sc-market.space/api{url}",
                 params=params
         ) as resp:
+            status = str(resp.status)
             if not resp.ok:
                 logger.warning(f"Public API returned non-OK status: {resp.status} for {url}")
                 logger.debug(f"Response headers: {dict(resp.headers)}")
             
-            result = await resp.json()
+            result = await resp.json(loads=codec.loads)
             logger.debug(f"Public fetch successful for {url}: {result}")
             return result
             
@@ -44,17 +58,21 @@ async def public_fetch(url, params=None, session=None):
         logger.error(f"Full traceback: {traceback.format_exc()}")
         raise
     finally:
+        # Endpoint templates keep IDs out of the metric labels
+        _record_request('public', 'GET', endpoint or url, status, start)
         if session is None and tempsession is not None:
             await tempsession.close()
             logger.debug("Closed temporary session for public fetch")
 
 
-async def internal_fetch(url, params=None, session=None):
+async def internal_fetch(url, params=None, session=None, endpoint=None):
     """Enhanced internal fetch with comprehensive error logging"""
     tempsession = None
+    status = 'error'
+    start = time.perf_counter()
     try:
         if session is None:
-            tempsession = aiohttp.ClientSession()
+            tempsession = aiohttp.ClientSession(json_serialize=codec.dumps)
             logger.debug(f"Created temporary session for internal fetch to {url}")
         else:
             tempsession = session
@@ -65,6 +83,7 @@ async def internal_fetch(url, params=None, session=None):
                 f"{DISCORD_BACKEND_URL}{url}",
                 params=params
         ) as resp:
+            status = str(resp.status)
             if not resp.ok:
                 logger.warning(f"Internal API returned non-OK status: {resp.status} for {url}")
                 logger.debug(f"Response headers: {dict(resp.headers)}")
@@ -74,7 +93,7 @@ async def internal_fetch(url, params=None, session=None):
                 except Exception as e:
                     logger.debug(f"Could not read error response body: {e}")
             
-            result = await resp.json()
+            result = await resp.json(loads=codec.loads)
             logger.debug(f"Internal fetch successful for {url}: {result}")
             return result
             
@@ -91,17 +110,21 @@ async def internal_fetch(url, params=None, session=None):
         logger.error(f"Full traceback: {traceback.format_exc()}")
         raise
     finally:
+        # Endpoint templates keep IDs out of the metric labels
+        _record_request('internal', 'GET', endpoint or url, status, start)
         if session is None and tempsession is not None:
             await tempsession.close()
             logger.debug("Closed temporary session for internal fetch")
 
 
-async def internal_post(url, params=None, json=None, session=None):
+async def internal_post(url, params=None, json=None, session=None, endpoint=None):
     """Enhanced internal post with comprehensive error logging"""
     tempsession = None
+    status = 'error'
+    start = time.perf_counter()
     try:
         if session is None:
-            tempsession = aiohttp.ClientSession()
+            tempsession = aiohttp.ClientSession(json_serialize=codec.dumps)
             logger.debug(f"Created temporary session for internal post to {url}")
         else:
             tempsession = session
@@ -113,6 +136,7 @@ async def internal_post(url, params=None, json=None, session=None):
                 params=params,
                 json=json,
         ) as resp:
+            status = str(resp.status)
             if not resp.ok:
                 logger.warning(f"Internal API returned non-OK status: {resp.status} for {url}")
                 logger.debug(f"Response headers: {dict(resp.headers)}")
@@ -122,7 +146,7 @@ async def internal_post(url, params=None, json=None, session=None):
                 except Exception as e:
                     logger.debug(f"Could not read error response body: {e}")
             
-            result = await resp.json()
+            result = await resp.json(loads=codec.loads)
             logger.debug(f"Internal post successful for {url}: {result}")
             return result
             
@@ -139,6 +163,8 @@ async def internal_post(url, params=None, json=None, session=None):
         logger.error(f"Full traceback: {traceback.format_exc()}")
         raise
     finally:
+        # Endpoint templates keep IDs out of the metric labels
+        _record_request('internal', 'POST', endpoint or url, status, start)
         if session is None and tempsession is not None:
             await tempsession.close()
             logger.debug("Closed temporary session for internal post")
@@ -148,7 +174,8 @@ async def get_user_orders(discord_id, session=None):
     """Enhanced user orders fetch with error logging"""
     try:
         logger.debug(f"Fetching orders for user {discord_id}")
-        response = await internal_fetch(f"/threads/user/{discord_id}/assigned", session=session)
+        response = await internal_fetch(f"/threads/user/{discord_id}/assigned", session=session,
+                                        endpoint="/threads/user/:discord_id/assigned")
         
         if 'orders' in response:
             orders = response['orders']
@@ -168,7 +195,8 @@ async def get_user_listings(discord_id, session=None):
     """Enhanced user listings fetch with error logging"""
     try:
         logger.debug(f"Fetching listings for user {discord_id}")
-        response = await internal_fetch(f"/threads/user/{discord_id}/listings", session=session)
+        response = await internal_fetch(f"/threads/user/{discord_id}/listings", session=session,
+                                        endpoint="/threads/user/:discord_id/listings")
         
         if 'listings' in response:
             listings = response['listings']
@@ -188,7 +216,8 @@ async def get_org_listings(contractor_id, discord_id, session=None):
     """Enhanced org listings fetch with error logging"""
     try:
         logger.debug(f"Fetching org listings for contractor {contractor_id}, user {discord_id}")
-        response = await internal_fetch(f"/threads/user/{discord_id}/listings/{contractor_id}", session=session)
+        response = await internal_fetch(f"/threads/user/{discord_id}/listings/{contractor_id}", session=session,
+                                        endpoint="/threads/user/:discord_id/listings/:contractor_id")
         
         if 'listings' in response:
             listings = response['listings']
@@ -208,7 +237,8 @@ async def get_user_orgs(discord_id, session=None):
     """Enhanced user orgs fetch with error logging"""
     try:
         logger.debug(f"Fetching orgs for user {discord_id}")
-        response = await internal_fetch(f"/threads/user/{discord_id}/contractors", session=session)
+        response = await internal_fetch(f"/threads/user/{discord_id}/contractors", session=session,
+                                        endpoint="/threads/user/:discord_id/contractors")
         
         if 'contractors' in response:
             contractors = response['contractors']
@@ -228,7 +258,7 @@ async def search_users(query, session=None):
     """Enhanced user search with error logging"""
     try:
         logger.debug(f"Searching users with query: {query}")
-        response = await public_fetch(f"/profile/search/{query}", session=session)
+        response = await public_fetch(f"/profile/search/{query}", session=session, endpoint="/profile/search/:query")
         logger.debug(f"User search returned {len(response) if isinstance(response, list) else 'unknown'} results")
         return response
         
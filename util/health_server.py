@@ -0,0 +1,106 @@
+import logging
+import math
+import time
+from typing import Dict, Any, Optional
+
+from aiohttp import web
+
+from util import codec
+from util.config import Config
+from util.metrics import metrics
+from util.sqs_client import SQSClient
+
+logger = logging.getLogger('SCMarketBot.HealthServer')
+
+
+class HealthServer:
+    """Embedded HTTP server exposing /live, /ready and /metrics for orchestrator probes and scrapes"""
+
+    def __init__(self, bot, host: str = '0.0.0.0', port: int = 8000):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.started_at = time.time()
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/live', self.live)
+        self.app.router.add_get('/ready', self.ready)
+        self.app.router.add_get('/metrics', self.scrape)
+
+    async def start(self):
+        """Start serving in the background on the bot's event loop"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Health server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("Health server stopped")
+
+    def gateway_latency(self) -> Optional[float]:
+        """Discord gateway heartbeat latency in seconds, None until the first heartbeat"""
+        latency = self.bot.latency
+        return latency if math.isfinite(latency) else None
+
+    def sqs_health(self) -> Optional[Dict[str, Any]]:
+        manager = getattr(self.bot, 'discord_sqs_manager', None)
+        return manager.get_health_status() if manager else None
+
+    async def live(self, request: web.Request) -> web.Response:
+        """Alive while the event loop answers and the client has not been closed"""
+        if self.bot.is_closed():
+            return web.json_response({'status': 'closed'}, status=503, dumps=codec.dumps)
+        return web.json_response({'status': 'alive', 'uptime': time.time() - self.started_at}, dumps=codec.dumps)
+
+    async def ready(self, request: web.Request) -> web.Response:
+        """Ready once the gateway is connected and, with SQS enabled, the Discord queue consumer is running"""
+        sqs_health = self.sqs_health()
+        problems = []
+        if not self.bot.is_ready():
+            problems.append('discord gateway not ready')
+        if Config.ENABLE_SQS and Config.ENABLE_DISCORD_QUEUE and not (sqs_health and sqs_health['consumer_task_running']):
+            problems.append('discord queue consumer not running')
+
+        body = {
+            'status': 'not_ready' if problems else 'ready',
+            'problems': problems,
+            'gateway_latency': self.gateway_latency(),
+            'sqs': sqs_health
+        }
+        return web.json_response(body, status=503 if problems else 200, dumps=codec.dumps)
+
+    async def scrape(self, request: web.Request) -> web.Response:
+        """Registry metrics plus gateway and consumer state, in the Prometheus text format"""
+        self._update_gauges()
+        return web.Response(text=metrics.render_text(), content_type='text/plain', charset='utf-8')
+
+    def _update_gauges(self):
+        """Copy point-in-time state into gauges so it is scraped alongside the recorded metrics"""
+        latency = self.gateway_latency()
+        if latency is not None:
+            metrics.gauge('discord_gateway_latency_seconds').set(latency)
+        metrics.gauge('discord_gateway_ready').set(int(self.bot.is_ready()))
+        metrics.gauge('process_uptime_seconds').set(time.time() - self.started_at)
+
+        health = self.sqs_health()
+        if not health:
+            return
+        metrics.gauge('sqs_consumer_running').set(int(bool(health['consumer_task_running'])))
+        metrics.gauge('sqs_consumer_restarts').set(health['restart_count'])
+
+        for lane, status in (health.get('lanes') or {}).items():
+            for field in ('active', 'waiting', 'processed', 'concurrency'):
+                metrics.gauge(f'discord_lane_{field}', lane=lane).set(status[field])
+
+        sqs = health.get('sqs_health') or {}
+        if 'quarantined' in sqs:
+            metrics.gauge('sqs_quarantined_messages').set(sqs['quarantined'])
+        for queue, status in sqs.get('consumers', {}).items():
+            label = SQSClient.queue_label(queue)
+            for field in ('workers', 'pollers', 'in_progress', 'receive_batch', 'receive_wait', 'arrival_rate'):
+                if status.get(field) is not None:
+                    metrics.gauge(f'sqs_consumer_{field}', queue=label).set(status[field])
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from util import codec
+
+logger = logging.getLogger('SCMarketBot.Idempotency')
+
+
+class IdempotencyStore:
+    """Bounded, TTL-evicting record of responses already produced for processed messages.
+
+    Lookups only touch the in-memory index. The optional sqlite copy is written behind on one dedicated
+    thread: everything stored or evicted while a write is in flight goes into the next transaction."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 345600, db_path: Optional[str] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._db = None
+        self._executor = None
+        # ('put', keys, response, stored_at) and ('delete', key) operations not yet handed to the thread
+        self._pending: List[Tuple] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # Optional sqlite backing so redeliveries after a restart are still recognised
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='idempotency')
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS processed (key TEXT PRIMARY KEY, response TEXT, stored_at REAL)')
+            self._db.commit()
+            self._load()
+
+        logger.info(f"Idempotency store initialized ({'sqlite: ' + db_path if db_path else 'in-memory'}, "
+                    f"max_entries={self.max_entries}, ttl={self.ttl}s)")
+
+    def _load(self):
+        """Restore unexpired entries from sqlite"""
+        self._db.execute('DELETE FROM processed WHERE stored_at < ?', (time.time() - self.ttl,))
+        self._db.commit()
+        rows = self._db.execute(
+            'SELECT key, response, stored_at FROM processed ORDER BY stored_at DESC LIMIT ?',
+            (self.max_entries,)
+        ).fetchall()
+        for key, response, stored_at in reversed(rows):
+            self._entries[key] = (stored_at, codec.loads(response))
+
+    def get(self, keys: Iterable[str]) -> Optional[Dict[str, Any]]:
+        """Return the stored response for the first key that is still live"""
+        now = time.time()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            stored_at, response = entry
+            if now - stored_at > self.ttl:
+                self._remove(key)
+                continue
+            self._entries.move_to_end(key)
+            return response
+        return None
+
+    def put(self, keys: Iterable[str], response: Dict[str, Any]):
+        """Record the response produced for a message under each of its keys"""
+        now = time.time()
+        keys = list(keys)
+        for key in keys:
+            self._entries[key] = (now, response)
+            self._entries.move_to_end(key)
+        if self._db is not None:
+            self._queue(('put', keys, response, now))
+        self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired entries from the cold end and enforce the size bound"""
+        while self._entries:
+            key, (stored_at, _) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - stored_at <= self.ttl:
+                break
+            self._remove(key)
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._queue(('delete', key))
+
+    def _queue(self, operation: Tuple):
+        self._pending.append(operation)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            operations, self._pending = self._pending, []
+            try:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._apply, operations)
+            except Exception as e:
+                logger.error(f"Failed to write {len(operations)} idempotency operations: {e}")
+
+    def _apply(self, operations: List[Tuple]):
+        """Apply queued operations in order, in a single transaction"""
+        with self._db:
+            for operation in operations:
+                if operation[0] == 'delete':
+                    self._db.execute('DELETE FROM processed WHERE key = ?', (operation[1],))
+                else:
+                    _, keys, response, stored_at = operation
+                    encoded = codec.dumps(response)
+                    self._db.executemany(
+                        'INSERT OR REPLACE INTO processed VALUES (?, ?, ?)',
+                        [(key, encoded, stored_at) for key in keys]
+                    )
+
+    async def flush(self):
+        """Wait until every stored response has been written"""
+        while self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def close(self):
+        if self._db is not None:
+            await self.flush()
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._db.close)
+            self._executor.shutdown(wait=False)
+            self._db = None
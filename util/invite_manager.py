@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+from util.metrics import metrics
+
+logger = logging.getLogger('SCMarketBot.InviteManager')
+
+
+class CachedInvite:
+    """An invite known to be valid, with its expiry and the uses handed out by this process"""
+
+    __slots__ = ('code', 'channel_id', 'expires_at', 'max_uses', 'allocated')
+
+    def __init__(self, code: str, channel_id: Optional[int], expires_at: Optional[float], max_uses: int = 0,
+                 allocated: int = 0):
+        self.code = code
+        self.channel_id = channel_id
+        # Wall-clock expiry, None for invites that never expire
+        self.expires_at = expires_at
+        # 0 means unlimited
+        self.max_uses = max_uses
+        self.allocated = allocated
+
+    def usable(self, uses: int, now: float, min_remaining: float) -> bool:
+        """Whether the invite can take `uses` more joins and stays valid for at least `min_remaining` seconds"""
+        if self.expires_at is not None and self.expires_at - now < min_remaining:
+            return False
+        return not self.max_uses or self.max_uses - self.allocated >= uses
+
+
+class InviteManager:
+    """Reuses invites per fulfillment channel across orders, minting new ones only when none is usable"""
+
+    def __init__(self, bot, max_age: int = 86400, max_uses: int = 0, min_remaining: float = 3600,
+                 sweep_interval: float = 600):
+        self.bot = bot
+        self.max_age = max_age
+        # Joins allowed on invites the bot creates; 0 creates each one with just the joins it is needed for
+        self.max_uses = max_uses
+        # An invite has to outlive the DM it is sent in, but never ask for more than half its lifetime
+        self.min_remaining = min(min_remaining, max_age / 2) if max_age else min_remaining
+        self.sweep_interval = sweep_interval
+        self._invites: Dict[int, List[CachedInvite]] = {}
+        # code -> (uses handed out, expiry), kept until the invite expires or is revoked so that caching the
+        # same invite again (a non-unique create, a re-check after a sweep) does not reset its count
+        self._allocated: Dict[str, Tuple[int, Optional[float]]] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._sweep_task: Optional[asyncio.Task] = None
+
+        bot.add_listener(self.on_invite_delete, 'on_invite_delete')
+        bot.add_listener(self.on_channel_delete, 'on_guild_channel_delete')
+        bot.add_listener(self.on_guild_remove, 'on_guild_remove')
+
+    def start(self):
+        """Start the background sweep of expired and revoked invites"""
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweep_task and not self._sweep_task.done():
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+        self._sweep_task = None
+
+    def _find(self, channel_id: int, uses: int) -> Optional[CachedInvite]:
+        now = time.time()
+        for invite in self._invites.get(channel_id, []):
+            if invite.usable(uses, now, self.min_remaining):
+                return invite
+        return None
+
+    def _remember(self, invite: discord.Invite, channel_id: Optional[int], default_max_uses: int) -> CachedInvite:
+        """Cache an invite, using default_max_uses when Discord did not report its use limit"""
+        expires_at = getattr(invite, 'expires_at', None)
+        if expires_at is not None:
+            expires_at = expires_at.timestamp()
+        elif getattr(invite, 'max_age', None):
+            expires_at = time.time() + invite.max_age
+
+        max_uses = getattr(invite, 'max_uses', None)
+        allocated, _ = self._allocated.get(invite.code, (0, None))
+        cached = CachedInvite(
+            invite.code,
+            channel_id,
+            expires_at,
+            default_max_uses if max_uses is None else max_uses,
+            max(getattr(invite, 'uses', None) or 0, allocated)
+        )
+        # Non-unique creates can hand back an invite that is already cached
+        self._uncache(cached.code)
+        self._invites.setdefault(channel_id, []).append(cached)
+        return cached
+
+    def _allocate(self, invite: CachedInvite, uses: int):
+        invite.allocated += uses
+        self._allocated[invite.code] = (invite.allocated, invite.expires_at)
+
+    def _uncache(self, code: str):
+        for invites in self._invites.values():
+            invites[:] = [invite for invite in invites if invite.code != code]
+
+    def forget(self, code: str):
+        """Drop an invite that no longer exists"""
+        self._uncache(code)
+        self._allocated.pop(code, None)
+
+    def claim(self, code: str, uses: int = 1) -> bool:
+        """Hand out `uses` joins of a cached invite, returning False unless it is cached and still has room"""
+        now = time.time()
+        for invites in self._invites.values():
+            for invite in invites:
+                if invite.code == code and invite.usable(uses, now, self.min_remaining):
+                    self._allocate(invite, uses)
+                    metrics.counter('discord_invites_total', source='reused').inc()
+                    return True
+        return False
+
+    def remember(self, invite: discord.Invite, uses: int = 0) -> str:
+        """Cache an invite validated elsewhere (e.g. by fetch_invite), counting `uses` against it.
+
+        fetch_invite does not report max_uses, so such invites are treated as single-use: the use handed out
+        here is the only one, and they are never reused."""
+        channel = getattr(invite, 'channel', None)
+        cached = self._remember(invite, channel.id if channel else None, 1)
+        self._allocate(cached, uses)
+        return cached.code
+
+    async def get_invite(self, channel: discord.abc.GuildChannel, uses: int = 1,
+                         reason: Optional[str] = None) -> str:
+        """Return the code of an invite to the channel with room for `uses` more joins, creating one if needed"""
+        # One create per channel at a time, so concurrent orders share the invite it produces
+        async with self._locks.setdefault(channel.id, asyncio.Lock()):
+            cached = self._find(channel.id, uses)
+            if cached is not None:
+                metrics.counter('discord_invites_total', source='reused').inc()
+            else:
+                metrics.counter('discord_invites_total', source='created').inc()
+                # Without a configured cap the invite only admits the joins asked for, never unlimited ones
+                max_uses = max(self.max_uses, uses)
+                invite = await metrics.timed(
+                    channel.create_invite(
+                        max_age=self.max_age,
+                        max_uses=max_uses,
+                        unique=False,
+                        reason=reason
+                    ),
+                    'discord_request',
+                    operation='create_invite'
+                )
+                cached = self._remember(invite, channel.id, max_uses)
+                logger.info(f"Created invite {cached.code} for channel {channel.id}")
+            self._allocate(cached, uses)
+            return cached.code
+
+    async def sweep(self):
+        """Drop invites that expired, ran out of uses or were revoked"""
+        now = time.time()
+        for channel_id, invites in list(self._invites.items()):
+            checked = list(invites)
+            live = []
+            for invite in checked:
+                if not invite.usable(1, now, self.min_remaining):
+                    continue
+                try:
+                    await metrics.timed(self.bot.fetch_invite(invite.code), 'discord_request', operation='fetch_invite')
+                except discord.NotFound:
+                    logger.info(f"Invite {invite.code} for channel {channel_id} was revoked")
+                    self._allocated.pop(invite.code, None)
+                    continue
+                except Exception as e:
+                    # Keep it on transient errors; the next sweep checks again
+                    logger.warning(f"Failed to validate invite {invite.code}: {e}")
+                live.append(invite)
+
+            # Orders may have cached new invites for this channel while the sweep was awaiting
+            if channel_id not in self._invites:
+                continue
+            current = self._invites[channel_id]
+            self._invites[channel_id] = [invite for invite in current if invite in live or invite not in checked]
+            if not self._invites[channel_id]:
+                del self._invites[channel_id]
+
+        for code, (_, expires_at) in list(self._allocated.items()):
+            if expires_at is not None and expires_at <= now:
+                del self._allocated[code]
+
+        metrics.gauge('discord_cached_invites').set(sum(len(invites) for invites in self._invites.values()))
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.sweep_interval)
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error sweeping invites: {e}")
+
+    async def on_invite_delete(self, invite: discord.Invite):
+        self.forget(invite.code)
+
+    def _drop_channel(self, channel_id: int):
+        # Invites die with their channel, so their counts can go too
+        for invite in self._invites.pop(channel_id, []):
+            self._allocated.pop(invite.code, None)
+
+    async def on_channel_delete(self, channel):
+        self._drop_channel(channel.id)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        for channel in guild.channels:
+            self._drop_channel(channel.id)
@@ -0,0 +1,191 @@
+import bisect
+import math
+import time
+from typing import Dict, Any, Awaitable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
+
+# Latency buckets in seconds, from sub-millisecond decodes up to long polls and slow handlers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Histogram:
+    """Observations counted into fixed buckets, with a running sum"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One slot per upper bound plus a final +Inf slot
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> List[int]:
+        """Observations at or below each upper bound, ending with the +Inf total"""
+        total, cumulative = 0, []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def percentile(self, pct: float) -> float:
+        """Estimate a percentile by interpolating within the bucket that contains it"""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    # Beyond the last bound all that is known is the bound itself
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """In-process registry of counters, gauges and histograms, each identified by name and labels"""
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, LabelKey], Any] = {}
+        self._types: Dict[str, str] = {}
+
+    def _get(self, kind: str, factory, name: str, labels: Dict[str, Any]):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            registered = self._types.setdefault(name, kind)
+            if registered != kind:
+                raise ValueError(f"Metric {name} is already registered as a {registered}")
+            metric = self._metrics[key] = factory()
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get('counter', Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self._get('gauge', Gauge, name, labels)
+
+    def histogram(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels) -> Histogram:
+        return self._get('histogram', lambda: Histogram(buckets), name, labels)
+
+    async def timed(self, awaitable: Awaitable[T], name: str, **labels) -> T:
+        """Await a call, recording its duration in <name>_seconds and failures in <name>_errors_total"""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception as e:
+            self.counter(f'{name}_errors_total', error=type(e).__name__, **labels).inc()
+            raise
+        finally:
+            self.histogram(f'{name}_seconds', **labels).observe(time.perf_counter() - start)
+
+    def collect(self) -> List[Tuple[str, str, Dict[str, str], Any]]:
+        """Every metric as (name, type, labels, metric), sorted by name and labels"""
+        return [
+            (name, self._types[name], dict(labels), metric)
+            for (name, labels), metric in sorted(self._metrics.items(), key=lambda item: item[0])
+        ]
+
+    def snapshot(self, name_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Plain values of every metric, with count, sum and p50/p95/p99 for histograms"""
+        snapshot = []
+        for name, kind, labels, metric in self.collect():
+            if name_prefix and not name.startswith(name_prefix):
+                continue
+            entry = {'name': name, 'type': kind, 'labels': labels}
+            if kind == 'histogram':
+                entry.update(
+                    count=metric.count,
+                    sum=metric.sum,
+                    p50=metric.percentile(50),
+                    p95=metric.percentile(95),
+                    p99=metric.percentile(99)
+                )
+            else:
+                entry['value'] = metric.value
+            snapshot.append(entry)
+        return snapshot
+
+    def render_text(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        typed = set()
+        for name, kind, labels, metric in self.collect():
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for bound, count in zip(metric.buckets + (float('inf'),), metric.cumulative_counts()):
+                    lines.append(f"{name}_bucket{_format_labels(labels, le=_format_value(bound))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(metric.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(metric.value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: Dict[str, str], **extra) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    escaped = (f'{label}="{_escape(value)}"' for label, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Process-wide registry shared by the SQS client, HTTP helpers and Discord calls
+metrics = MetricsRegistry()
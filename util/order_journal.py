@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from util import codec
+
+logger = logging.getLogger('SCMarketBot.OrderJournal')
+
+
+class OrderCheckpoint:
+    """Steps already completed while processing one order, so a retry can resume where it stopped"""
+
+    def __init__(self, journal: Optional['OrderJournal'], entity_id: Optional[str], steps: Optional[Dict[str, Any]] = None):
+        self.journal = journal
+        self.entity_id = entity_id
+        self.steps = steps or {}
+
+    def done(self, step: str) -> bool:
+        return step in self.steps
+
+    def get(self, step: str, default: Any = None) -> Any:
+        return self.steps.get(step, default)
+
+    def record(self, step: str, value: Any = True):
+        """Mark a step as completed, persisting it in the background when the order has an entity ID"""
+        self.steps[step] = value
+        if self.journal and self.entity_id:
+            self.journal.write(self.entity_id, step, value)
+
+    def reset(self):
+        """Forget every completed step, e.g. when the thread they refer to was deleted"""
+        self.steps = {}
+        if self.journal and self.entity_id:
+            self.journal.clear(self.entity_id)
+
+
+class OrderJournal:
+    """Small sqlite journal of completed order processing steps, keyed by entity ID.
+
+    The database is only touched from one dedicated thread. Steps are written behind: everything recorded
+    while a write is in flight goes into the next transaction, so the event loop never waits on the disk."""
+
+    def __init__(self, db_path: Optional[str] = None, ttl: float = 345600, sweep_interval: float = 3600):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='order-journal')
+        self._db = sqlite3.connect(db_path or ':memory:', check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS steps (entity_id TEXT, step TEXT, value TEXT, recorded_at REAL, '
+            'PRIMARY KEY (entity_id, step))'
+        )
+        self._db.commit()
+
+        # ('write', entity_id, step, value) and ('clear', entity_id) operations not yet handed to the thread
+        self._pending: List[Tuple] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._sweep_task: Optional[asyncio.Task] = None
+        logger.info(f"Order journal initialized ({'sqlite: ' + db_path if db_path else 'in-memory'})")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def start(self):
+        """Start the periodic sweep of expired entries"""
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def checkpoint(self, entity_id: Optional[str]) -> OrderCheckpoint:
+        """Load the completed steps for an entity (orders without an ID are tracked in memory only)"""
+        if not entity_id:
+            return OrderCheckpoint(None, None)
+
+        entity_id = str(entity_id)
+        # Queued operations are applied by the same job ahead of the read, so the load sees every recorded step
+        operations, self._pending = self._pending, []
+        steps = await self._run(self._apply_and_load, operations, entity_id)
+        if steps:
+            logger.info(f"Resuming order {entity_id} with completed steps: {sorted(steps)}")
+        return OrderCheckpoint(self, entity_id, steps)
+
+    def _apply_and_load(self, operations: List[Tuple], entity_id: str) -> Dict[str, Any]:
+        if operations:
+            try:
+                self._apply(operations)
+            except Exception as e:
+                logger.error(f"Failed to write {len(operations)} order journal operations: {e}")
+        rows = self._db.execute(
+            'SELECT step, value FROM steps WHERE entity_id = ? AND recorded_at >= ?',
+            (entity_id, time.time() - self.ttl)
+        )
+        return {step: codec.loads(value) for step, value in rows}
+
+    def write(self, entity_id: str, step: str, value: Any):
+        self._pending.append(('write', entity_id, step, value))
+        self._schedule_flush()
+
+    def clear(self, entity_id: str):
+        self._pending.append(('clear', entity_id))
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            operations, self._pending = self._pending, []
+            try:
+                await self._run(self._apply, operations)
+            except Exception as e:
+                logger.error(f"Failed to write {len(operations)} order journal operations: {e}")
+
+    def _apply(self, operations: List[Tuple]):
+        """Apply queued operations in order, in a single transaction"""
+        now = time.time()
+        with self._db:
+            for operation in operations:
+                if operation[0] == 'clear':
+                    self._db.execute('DELETE FROM steps WHERE entity_id = ?', (operation[1],))
+                else:
+                    _, entity_id, step, value = operation
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?)',
+                        (entity_id, step, codec.dumps(value), now)
+                    )
+
+    async def flush(self):
+        """Wait until every recorded step has been written"""
+        while self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+
+    def _expire(self) -> int:
+        with self._db:
+            return self._db.execute('DELETE FROM steps WHERE recorded_at < ?', (time.time() - self.ttl,)).rowcount
+
+    async def sweep(self) -> int:
+        """Delete entries older than the TTL"""
+        removed = await self._run(self._expire)
+        if removed:
+            logger.debug(f"Removed {removed} expired order journal entries")
+        return removed
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await self.sweep()
+                await asyncio.sleep(self.sweep_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error sweeping order journal: {e}")
+                await asyncio.sleep(self.sweep_interval)
+
+    async def close(self):
+        if self._sweep_task and not self._sweep_task.done():
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+        self._sweep_task = None
+
+        await self.flush()
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+from typing import Dict, Any
+
+logger = logging.getLogger('SCMarketBot.DiscordSQSConsumer')
+
+
+class PriorityLimiter:
+    """Concurrency limit shared by all lanes that hands each freed slot to the highest-priority waiter"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int):
+        """Wait for a slot; lower priority values are served first, FIFO within a priority"""
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the cancellation landed
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Pass the slot straight to the next live waiter, or free it"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class MessageLane:
+    """A class of message types sharing a priority and a concurrency cap"""
+
+    def __init__(self, name: str, priority: int, concurrency: int):
+        self.name = name
+        self.priority = priority
+        self.concurrency = max(1, concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.processed = 0
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, limiter: PriorityLimiter):
+        """Hold one of this lane's slots and one shared slot while a message is handled"""
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+            try:
+                await limiter.acquire(self.priority)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.processed += 1
+            limiter.release()
+            self._semaphore.release()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'priority': self.priority,
+            'concurrency': self.concurrency,
+            'active': self.active,
+            'waiting': self.waiting,
+            'processed': self.processed
+        }
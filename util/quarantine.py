@@ -0,0 +1,73 @@
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+from util import codec
+
+logger = logging.getLogger('SCMarketBot.SQS')
+
+
+class QuarantineStore:
+    """Local sqlite store for poison messages removed from their source queue"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(db_path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS quarantine (id TEXT PRIMARY KEY, message_id TEXT, queue_url TEXT, '
+            'body TEXT, message_attributes TEXT, receive_count INTEGER, reason TEXT, quarantined_at REAL)'
+        )
+        self._db.commit()
+        logger.info(f"Quarantine store opened at {db_path}")
+
+    def add(self, message: Dict[str, Any], queue_url: str, receive_count: int, reason: str) -> str:
+        """Store a received message and return its quarantine entry ID"""
+        entry_id = uuid.uuid4().hex[:12]
+        # Only string-typed attributes survive the round trip through JSON
+        attributes = {
+            name: value for name, value in message.get('MessageAttributes', {}).items()
+            if 'StringValue' in value
+        }
+        self._db.execute(
+            'INSERT INTO quarantine VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (entry_id, message.get('MessageId', 'unknown'), queue_url, message.get('Body', ''),
+             codec.dumps(attributes), receive_count, reason, time.time())
+        )
+        self._db.commit()
+        return entry_id
+
+    @staticmethod
+    def _to_entry(row: sqlite3.Row) -> Dict[str, Any]:
+        entry = dict(row)
+        entry['message_attributes'] = codec.loads(entry['message_attributes'])
+        return entry
+
+    def list(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return the most recently quarantined entries"""
+        rows = self._db.execute('SELECT * FROM quarantine ORDER BY quarantined_at DESC LIMIT ?', (limit,))
+        return [self._to_entry(row) for row in rows]
+
+    def get(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Return one quarantine entry"""
+        row = self._db.execute('SELECT * FROM quarantine WHERE id = ?', (entry_id,)).fetchone()
+        return self._to_entry(row) if row else None
+
+    def remove(self, entry_id: str):
+        """Drop an entry once it has been re-driven"""
+        self._db.execute('DELETE FROM quarantine WHERE id = ?', (entry_id,))
+        self._db.commit()
+
+    def count(self) -> int:
+        """Number of quarantined messages"""
+        return self._db.execute('SELECT COUNT(*) FROM quarantine').fetchone()[0]
+
+    def close(self):
+        self._db.close()
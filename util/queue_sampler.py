@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger('SCMarketBot.SQS')
+
+
+class QueueMetricsSampler:
+    """Samples one queue's attributes in the background and caches them for every reader"""
+
+    def __init__(self, sqs_client, queue_url: str, interval: float = 15):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.interval = interval
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.sample_count = 0
+        self._task = None
+        self._refresh_lock = asyncio.Lock()
+
+    def start(self):
+        """Start background sampling if it is not already running"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop background sampling"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        """Refresh the snapshot every interval"""
+        while True:
+            try:
+                await self.refresh()
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Queue metrics sampler error for {self.queue_url}: {e}")
+                await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> Optional[Dict[str, Any]]:
+        """Fetch fresh attributes, sharing one in-flight request between concurrent callers"""
+        started_at = time.time()
+        async with self._refresh_lock:
+            # Another caller refreshed while we waited for the lock
+            if self.snapshot and self.snapshot['sampled_at'] >= started_at:
+                return self.snapshot
+
+            attributes = await self.sqs_client.get_queue_attributes(self.queue_url)
+            if attributes is None:
+                return self.snapshot
+
+            depth = int(attributes.get('ApproximateNumberOfMessages', 0))
+
+            # Track how long the queue has continuously had a backlog
+            backlog_since = None
+            if depth > 0:
+                previous = self.snapshot
+                backlog_since = previous['backlog_since'] if previous and previous['backlog_since'] else time.time()
+
+            self.snapshot = {
+                'depth': depth,
+                'in_flight': int(attributes.get('ApproximateNumberOfMessagesNotVisible', 0)),
+                'delayed': int(attributes.get('ApproximateNumberOfMessagesDelayed', 0)),
+                'sampled_at': time.time(),
+                'backlog_since': backlog_since,
+                'attributes': attributes
+            }
+            self.sample_count += 1
+            return self.snapshot
+
+    async def get(self, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Return the cached snapshot, refreshing it first if it is older than max_age"""
+        max_age = self.interval * 2 if max_age is None else max_age
+        if self.snapshot is None or time.time() - self.snapshot['sampled_at'] > max_age:
+            await self.refresh()
+        return self.snapshot
+
+    def peek(self) -> Optional[Dict[str, Any]]:
+        """Return the cached snapshot without any API call"""
+        return self.snapshot
+
+    @staticmethod
+    def age(snapshot: Dict[str, Any]) -> float:
+        """Seconds since a snapshot was sampled"""
+        return time.time() - snapshot['sampled_at']
@@ -0,0 +1,58 @@
+import math
+import time
+from collections import deque
+from typing import Tuple
+
+
+class ReceiveTuner:
+    """Chooses ReceiveMessage batch size and long-poll wait from recent arrival rate and handler latency"""
+
+    def __init__(self, max_messages: int, max_wait: int, min_wait: int = 1, window: float = 30):
+        self.max_messages = max(1, max_messages)
+        self.max_wait = max_wait
+        self.min_wait = min(min_wait, max_wait)
+        self.window = window
+        self.batch_size = self.max_messages
+        self.wait_time = self.max_wait
+        self._receipts = deque()
+        self._last_full = False
+        self._started = time.monotonic()
+
+    @property
+    def arrival_rate(self) -> float:
+        """Messages received per second over the recent window"""
+        now = time.monotonic()
+        self._expire(now)
+        if not self._receipts:
+            return 0.0
+        # Until a full window has passed, average over the time observed so far
+        span = max(1.0, min(self.window, now - self._started))
+        return sum(count for _, count in self._receipts) / span
+
+    def _expire(self, now: float):
+        while self._receipts and now - self._receipts[0][0] > self.window:
+            self._receipts.popleft()
+
+    def record(self, received: int, requested: int):
+        """Record the outcome of one receive"""
+        if received:
+            self._receipts.append((time.monotonic(), received))
+        self._last_full = received >= requested
+
+    def next_params(self, latency: float, backlog: bool) -> Tuple[int, int]:
+        """Return (batch size, wait seconds) for the next receive"""
+        rate = self.arrival_rate
+
+        if backlog or self._last_full:
+            # Draining: take full batches and never sit in a long poll
+            batch, wait = self.max_messages, self.min_wait
+        elif rate <= 0:
+            # Idle: one cheap long poll at a time, woken by the first arrival
+            batch, wait = 1, self.max_wait
+        else:
+            # Take about what arrives while a handler runs, and wait about as long as that takes to arrive
+            batch = max(1, min(self.max_messages, math.ceil(rate * max(latency, 1.0))))
+            wait = max(self.min_wait, min(self.max_wait, math.ceil(batch / rate)))
+
+        self.batch_size, self.wait_time = batch, wait
+        return batch, wait
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import math
+from typing import Dict, Any
+
+logger = logging.getLogger('SCMarketBot.SQS')
+
+
+class SQSAutoscaler:
+    """Adds or removes pollers and workers on a consumer pipeline based on queue depth and handler latency"""
+
+    def __init__(self, sqs_client, queue_name: str, settings: Dict[str, Any]):
+        self.sqs_client = sqs_client
+        self.queue_name = queue_name
+        self.min_pollers = max(1, settings['min_pollers'])
+        self.max_pollers = max(self.min_pollers, settings['max_pollers'])
+        self.min_workers = max(1, settings['min_workers'])
+        self.max_workers = max(self.min_workers, settings['max_workers'])
+        self.interval = settings['interval']
+        self.target_drain_seconds = max(1.0, settings['target_drain_seconds'])
+        self.scale_down_cooldown = settings['scale_down_cooldown']
+        self._base_buffer_size = None
+        self._scale_down_votes = 0
+        self.last_decision = {}
+
+    def desired_capacity(self, depth: int, in_flight: int, latency: float, in_progress: int,
+                         max_messages: int) -> Dict[str, int]:
+        """Compute the poller and worker counts needed to drain the backlog within the target time"""
+        # Little's law: concurrency = throughput * latency, with a floor so an idle pipeline still scales up
+        required_throughput = depth / self.target_drain_seconds
+        workers = math.ceil(required_throughput * max(latency, 0.1))
+
+        # Never shrink below the work that is already running
+        workers = max(workers, in_progress, self.min_workers)
+        workers = min(workers, self.max_workers)
+
+        if depth > 0:
+            # Each poller brings in at most max_messages per round trip
+            pollers = math.ceil(workers / max(1, max_messages))
+        else:
+            pollers = self.min_pollers
+        pollers = max(self.min_pollers, min(pollers, self.max_pollers))
+
+        return {'workers': workers, 'pollers': pollers, 'depth': depth, 'in_flight': in_flight}
+
+    async def run(self):
+        """Periodically resize the queue's consumer pipeline"""
+        logger.info(f"Autoscaler started for queue {self.queue_name}: pollers {self.min_pollers}-{self.max_pollers}, "
+                    f"workers {self.min_workers}-{self.max_workers}")
+        while True:
+            try:
+                await asyncio.sleep(self.interval)
+                await self._evaluate()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Autoscaler error for queue {self.queue_name}: {e}")
+
+    async def _evaluate(self):
+        """Take one scaling decision"""
+        pipeline = self.sqs_client.consumers.get(self.queue_name)
+        if pipeline is None:
+            return
+
+        metrics = await self.sqs_client.get_queue_metrics(self.queue_name)
+        if not metrics:
+            return
+
+        if self._base_buffer_size is None:
+            self._base_buffer_size = pipeline.buffer_size
+
+        decision = self.desired_capacity(
+            metrics['depth'],
+            metrics['in_flight'],
+            pipeline.average_latency,
+            pipeline.in_progress,
+            pipeline.max_messages
+        )
+        self.last_decision = decision
+
+        scaling_up = decision['workers'] > pipeline.worker_target or decision['pollers'] > pipeline.poller_target
+        scaling_down = decision['workers'] < pipeline.worker_target or decision['pollers'] < pipeline.poller_target
+
+        if scaling_up:
+            self._scale_down_votes = 0
+        elif scaling_down:
+            # Require several consecutive low readings before giving capacity back
+            self._scale_down_votes += 1
+            if self._scale_down_votes < self.scale_down_cooldown:
+                return
+            self._scale_down_votes = 0
+        else:
+            return
+
+        logger.info(f"Autoscaling queue {self.queue_name}: depth={decision['depth']}, in_flight={decision['in_flight']}, "
+                    f"latency={pipeline.average_latency:.2f}s -> workers {pipeline.worker_target}->{decision['workers']}, "
+                    f"pollers {pipeline.poller_target}->{decision['pollers']}")
+
+        # Give every poller room for a full receive so added pollers are not starved by the buffer bound
+        pipeline.buffer_size = max(self._base_buffer_size, decision['pollers'] * pipeline.max_messages)
+        pipeline.set_workers(decision['workers'])
+        pipeline.set_pollers(decision['pollers'])
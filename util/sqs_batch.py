@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from typing import Dict, Any, List, Tuple
+
+from util.metrics import metrics
+
+logger = logging.getLogger('SCMarketBot.SQS')
+
+# SQS rejects batch requests with more than 10 entries
+SQS_MAX_BATCH_ENTRIES = 10
+
+
+class SQSBatchAccumulator:
+    """Collects entries for one queue and flushes them as SQS batch calls on a size or time trigger"""
+
+    # SQS batch operation the entries are flushed with
+    operation = None
+    # Upper bound on the combined payload of one batch request, None for no limit
+    max_batch_bytes = None
+
+    def __init__(self, transport, queue_url: str, max_batch_size: int = SQS_MAX_BATCH_ENTRIES,
+                 flush_interval: float = 0.5):
+        self.transport = transport
+        self.queue_url = queue_url
+        self.max_batch_size = max(1, min(max_batch_size, SQS_MAX_BATCH_ENTRIES))
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[str, Dict[str, Any], str, asyncio.Future]] = []
+        self._pending_bytes = 0
+        self._next_id = 0
+        self._timer_task = None
+        self._flush_tasks = set()
+
+    def add(self, entry: Dict[str, Any], label: str = 'unknown', size: int = 0) -> asyncio.Future:
+        """Queue an entry and return a future resolving to True once SQS confirms it"""
+        # Flush early if this entry would push the batch over the request size limit
+        if self.max_batch_bytes and self._pending and self._pending_bytes + size > self.max_batch_bytes:
+            self._start_flush()
+
+        future = asyncio.get_event_loop().create_future()
+        entry_id = str(self._next_id)
+        self._next_id += 1
+        self._pending.append((entry_id, entry, label, future))
+        self._pending_bytes += size
+
+        if len(self._pending) >= self.max_batch_size:
+            self._start_flush()
+        elif self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._flush_after_interval())
+
+        return future
+
+    async def _flush_after_interval(self):
+        """Flush whatever has accumulated once the linger interval expires"""
+        try:
+            await asyncio.sleep(self.flush_interval)
+            self._timer_task = None
+            self._start_flush()
+        except asyncio.CancelledError:
+            pass
+
+    def _start_flush(self):
+        """Take every pending entry and send it in the background"""
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+        self._timer_task = None
+
+        pending, self._pending = self._pending, []
+        self._pending_bytes = 0
+        if not pending:
+            return
+
+        task = asyncio.create_task(self._send_chunks(pending))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _send_chunks(self, pending: List[Tuple[str, Dict[str, Any], str, asyncio.Future]]):
+        """Send pending entries in chunks of at most max_batch_size"""
+        for i in range(0, len(pending), self.max_batch_size):
+            chunk = pending[i:i + self.max_batch_size]
+            futures = {entry_id: (label, future) for entry_id, _, label, future in chunk}
+
+            try:
+                response = await metrics.timed(
+                    self._send_batch([dict(entry, Id=entry_id) for entry_id, entry, _, _ in chunk]),
+                    'sqs_request',
+                    operation=self.operation
+                )
+            except Exception as e:
+                logger.error(f"{type(self).__name__} batch of {len(chunk)} entries failed for {self.queue_url}: {e}")
+                for label, future in futures.values():
+                    if not future.done():
+                        future.set_result(False)
+                continue
+
+            for success in response.get('Successful', []):
+                label, future = futures.pop(success['Id'], (None, None))
+                if future is not None and not future.done():
+                    future.set_result(True)
+
+            for failure in response.get('Failed', []):
+                label, future = futures.pop(failure['Id'], (None, None))
+                logger.error(f"{type(self).__name__} entry for {label} failed: {failure.get('Code')} - "
+                             f"{failure.get('Message')} (sender_fault={failure.get('SenderFault')})")
+                if future is not None and not future.done():
+                    future.set_result(False)
+
+            # Entries SQS did not mention at all are treated as failed
+            for label, future in futures.values():
+                logger.error(f"{type(self).__name__} entry for {label} missing from batch response")
+                if not future.done():
+                    future.set_result(False)
+
+    async def _send_batch(self, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Send one batch request"""
+        return await self.transport.request(self.operation, {
+            'QueueUrl': self.queue_url,
+            'Entries': entries
+        })
+
+    def send_pending(self):
+        """Start sending everything pending now, without waiting for the linger interval or the result"""
+        self._start_flush()
+
+    async def flush(self):
+        """Send everything pending and wait for all outstanding batch calls"""
+        self._start_flush()
+        if self._flush_tasks:
+            await asyncio.gather(*list(self._flush_tasks), return_exceptions=True)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+
+class DeleteBatcher(SQSBatchAccumulator):
+    """Acknowledges processed messages with DeleteMessageBatch"""
+
+    operation = 'DeleteMessageBatch'
+
+    def delete(self, receipt_handle: str, message_id: str = 'unknown') -> asyncio.Future:
+        """Queue a receipt handle for deletion"""
+        return self.add({'ReceiptHandle': receipt_handle}, message_id)
+
+
+class SendBatcher(SQSBatchAccumulator):
+    """Coalesces outgoing messages into SendMessageBatch calls"""
+
+    operation = 'SendMessageBatch'
+
+    # SQS limits the combined size of all messages in one SendMessageBatch request
+    max_batch_bytes = 256 * 1024
+
+    def send(self, message_body: str, message_attributes: Dict[str, Any], label: str = 'unknown') -> asyncio.Future:
+        """Queue a message for sending"""
+        size = len(message_body.encode('utf-8'))
+        for name, attribute in message_attributes.items():
+            size += len(name) + len(attribute['DataType']) + len(attribute.get('StringValue', ''))
+
+        entry = {'MessageBody': message_body}
+        if message_attributes:
+            entry['MessageAttributes'] = message_attributes
+        return self.add(entry, label, size)
@@ -1,13 +1,24 @@
 import asyncio
-import json
 import logging
+import math
 import os
 import time
 from typing import Dict, Any, Optional, Callable
 
-import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
+import itertools
 import traceback
+from collections import deque
+
+from util import codec
+from util.config import Config
+from util.metrics import metrics
+from util.quarantine import QuarantineStore
+from util.queue_sampler import QueueMetricsSampler
+from util.receive_tuner import ReceiveTuner
+from util.sqs_batch import DeleteBatcher, SendBatcher, SQS_MAX_BATCH_ENTRIES
+from util.sqs_message import LazyMessageBody, PermanentMessageError
+from util.sqs_transport import create_transport
 
 logger = logging.getLogger('SCMarketBot.SQS')
 
@@ -16,31 +27,37 @@ class SQSClient:
         self.sqs = None
         self.queues = {}
         self.consumers = {}
+        self.delete_batchers = {}
+        self.send_batchers = {}
+        self.samplers = {}
+        self.quarantine = None
         self._init_client()
         self.last_message_time = time.time()
         self.message_count = 0
         self.error_count = 0
         
     def _init_client(self):
-        """Initialize the SQS client with AWS credentials"""
+        """Initialize the SQS transport with AWS credentials"""
         try:
             # Try to get credentials from environment variables
             aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
             aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
             aws_region = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
             
-            if aws_access_key and aws_secret_key:
-                self.sqs = boto3.client(
-                    'sqs',
-                    aws_access_key_id=aws_access_key,
-                    aws_secret_access_key=aws_secret_key,
-                    region_name=aws_region
-                )
-            else:
-                # Try to use IAM roles or default credentials
-                self.sqs = boto3.client('sqs', region_name=aws_region)
+            # Without explicit keys the transport falls back to IAM roles or default credentials
+            self.sqs = create_transport(
+                Config.SQS_TRANSPORT,
+                aws_region,
+                aws_access_key,
+                aws_secret_key,
+                Config.SQS_ENDPOINT_URL,
+                Config.SQS_HTTP_POOL_SIZE,
+                Config.SQS_LOCAL_DB,
+                self._executor_size(),
+                Config.SQS_MAX_ATTEMPTS
+            )
                 
-            logger.info(f"SQS client initialized successfully in region {aws_region}")
+            logger.info(f"SQS client initialized successfully in region {aws_region} using {Config.SQS_TRANSPORT} transport")
             
         except NoCredentialsError:
             logger.error("AWS credentials not found. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY")
@@ -49,13 +66,51 @@ class SQSClient:
             logger.error(f"Failed to initialize SQS client: {e}")
             self.sqs = None
     
-    def get_queue_url(self, queue_name: str) -> Optional[str]:
-        """Get the URL for a queue by name"""
+    @staticmethod
+    def _executor_size() -> int:
+        """Threads the boto3 transport needs so long polls never starve deletes, sends and heartbeats"""
+        if Config.SQS_EXECUTOR_WORKERS > 0:
+            return Config.SQS_EXECUTOR_WORKERS
+        
+        consumer = Config.SQS_CONSUMER_SETTINGS
+        autoscale = Config.SQS_AUTOSCALE_SETTINGS
+        pollers = max(consumer['pollers'], autoscale['max_pollers'] if autoscale['enabled'] else 0)
+        workers = max(consumer['workers'], autoscale['max_workers'] if autoscale['enabled'] else 0)
+        
+        # Every poller can hold a thread for a whole long poll; the remaining calls are short ones issued on
+        # behalf of workers (batched deletes and sends, visibility heartbeats, attribute samples)
+        return pollers + max(4, math.ceil(workers / 5))
+    
+    async def _call(self, operation: str, **params) -> Dict[str, Any]:
+        """Invoke an SQS API operation through the configured transport"""
+        return await metrics.timed(self.sqs.request(operation, params), 'sqs_request', operation=operation)
+    
+    @staticmethod
+    def queue_label(queue_url: str) -> str:
+        """Short queue name used to label metrics"""
+        return queue_url.rstrip('/').rsplit('/', 1)[-1]
+    
+    @staticmethod
+    def is_queue_url(queue: str) -> bool:
+        """Check whether a queue reference is already a full queue URL"""
+        return queue.startswith('https://') or queue.startswith('http://')
+    
+    async def get_queue_url(self, queue_name: str) -> Optional[str]:
+        """Get the URL for a queue by name, or pass a full queue URL straight through"""
         if not self.sqs:
             return None
+        
+        if self.is_queue_url(queue_name):
+            return queue_name
+        
+        # Resolved URLs never change for the lifetime of a queue, so cache them
+        cached_url = self.queues.get(queue_name)
+        if cached_url:
+            return cached_url
             
         try:
-            response = self.sqs.get_queue_url(QueueName=queue_name)
+            response = await self._call('GetQueueUrl', QueueName=queue_name)
+            self.queues[queue_name] = response['QueueUrl']
             return response['QueueUrl']
         except ClientError as e:
             if e.response['Error']['Code'] == 'AWS.SimpleQueueService.NonExistentQueue':
@@ -63,24 +118,24 @@ class SQSClient:
             else:
                 logger.error(f"Error getting queue URL for '{queue_name}': {e}")
             return None
+        except Exception as e:
+            logger.error(f"Error getting queue URL for '{queue_name}': {e}")
+            return None
     
     async def get_queue_attributes(self, queue_name: str) -> Optional[Dict[str, Any]]:
-        """Get queue attributes including depth and other metrics"""
+        """Get queue attributes including depth and other metrics (accepts a queue name or URL)"""
         if not self.sqs:
             return None
             
         try:
-            queue_url = self.get_queue_url(queue_name)
+            queue_url = await self.get_queue_url(queue_name)
             if not queue_url:
                 return None
                 
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.sqs.get_queue_attributes(
-                    QueueUrl=queue_url,
-                    AttributeNames=['All']
-                )
+            response = await self._call(
+                'GetQueueAttributes',
+                QueueUrl=queue_url,
+                AttributeNames=['All']
             )
             
             return response.get('Attributes', {})
@@ -89,41 +144,68 @@ class SQSClient:
             logger.error(f"Failed to get queue attributes for '{queue_name}': {e}")
             return None
     
+    def get_queue_sampler(self, queue_url: str) -> QueueMetricsSampler:
+        """Get the queue's shared metrics sampler, starting it on first use"""
+        sampler = self.samplers.get(queue_url)
+        if sampler is None:
+            sampler = QueueMetricsSampler(self, queue_url, Config.SQS_CONSUMER_SETTINGS['metrics_sample_interval'])
+            self.samplers[queue_url] = sampler
+        sampler.start()
+        return sampler
+    
+    async def stop_queue_sampler(self, queue_url: str):
+        """Stop a queue's background sampling; the next metrics read starts it again"""
+        sampler = self.samplers.get(queue_url)
+        if sampler is not None:
+            await sampler.stop()
+    
+    async def get_queue_metrics(self, queue_name: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Get cached depth, in-flight and age metrics for a queue (name or URL) from its shared sampler"""
+        if not self.sqs:
+            return None
+        
+        queue_url = await self.get_queue_url(queue_name)
+        if not queue_url:
+            return None
+        
+        return await self.get_queue_sampler(queue_url).get(max_age)
+    
+    @staticmethod
+    def _format_message_attributes(message_attributes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Convert plain attribute values into SQS message attribute structures"""
+        message_attrs = {}
+        if message_attributes:
+            for key, value in message_attributes.items():
+                if isinstance(value, str):
+                    message_attrs[key] = {
+                        'StringValue': value,
+                        'DataType': 'String'
+                    }
+                elif isinstance(value, (int, float)):
+                    message_attrs[key] = {
+                        'StringValue': str(value),
+                        'DataType': 'Number'
+                    }
+        return message_attrs
+    
     async def send_message(self, queue_name: str, message_body: Dict[str, Any], 
                           message_attributes: Optional[Dict[str, Any]] = None) -> bool:
-        """Send a message to an SQS queue"""
+        """Send a message to an SQS queue (accepts a queue name or URL)"""
         if not self.sqs:
             logger.error("SQS client not initialized")
             return False
             
         try:
-            queue_url = self.get_queue_url(queue_name)
+            queue_url = await self.get_queue_url(queue_name)
             if not queue_url:
                 return False
-                
-            message_attrs = {}
-            if message_attributes:
-                for key, value in message_attributes.items():
-                    if isinstance(value, str):
-                        message_attrs[key] = {
-                            'StringValue': value,
-                            'DataType': 'String'
-                        }
-                    elif isinstance(value, (int, float)):
-                        message_attrs[key] = {
-                            'StringValue': str(value),
-                            'DataType': 'Number'
-                        }
             
-            # Use thread pool to avoid blocking the event loop
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.sqs.send_message(
-                    QueueUrl=queue_url,
-                    MessageBody=json.dumps(message_body),
-                    MessageAttributes=message_attrs
-                )
+            body, body_attributes = codec.encode_body(message_body)
+            response = await self._call(
+                'SendMessage',
+                QueueUrl=queue_url,
+                MessageBody=body,
+                MessageAttributes=self._format_message_attributes({**(message_attributes or {}), **body_attributes})
             )
             
             logger.info(f"Message sent to queue '{queue_name}' with ID: {response['MessageId']}")
@@ -133,86 +215,268 @@ class SQSClient:
             logger.error(f"Failed to send message to queue '{queue_name}': {e}")
             return False
     
+    async def send_message_batched(self, queue_name: str, message_body: Dict[str, Any],
+                                   message_attributes: Optional[Dict[str, Any]] = None) -> bool:
+        """Send a message through the queue's SendMessageBatch buffer and report its individual outcome"""
+        if not self.sqs:
+            logger.error("SQS client not initialized")
+            return False
+        
+        try:
+            queue_url = await self.get_queue_url(queue_name)
+            if not queue_url:
+                return False
+            
+            batcher = self.send_batchers.get(queue_url)
+            if batcher is None:
+                batcher = SendBatcher(
+                    self.sqs,
+                    queue_url,
+                    Config.SQS_CONSUMER_SETTINGS['send_batch_size'],
+                    Config.SQS_CONSUMER_SETTINGS['send_linger']
+                )
+                self.send_batchers[queue_url] = batcher
+            
+            body, body_attributes = codec.encode_body(message_body)
+            success = await batcher.send(
+                body,
+                self._format_message_attributes({**(message_attributes or {}), **body_attributes}),
+                message_body.get('type', 'message')
+            )
+            
+            if success:
+                logger.info(f"Message sent to queue '{queue_name}' via batch")
+            else:
+                logger.error(f"Batched send to queue '{queue_name}' failed")
+            return success
+            
+        except Exception as e:
+            logger.error(f"Failed to send message to queue '{queue_name}': {e}")
+            return False
+    
+    def _get_delete_batcher(self, queue_url: str) -> DeleteBatcher:
+        """Get or create the delete accumulator for a queue"""
+        batcher = self.delete_batchers.get(queue_url)
+        if batcher is None:
+            batcher = DeleteBatcher(
+                self.sqs,
+                queue_url,
+                Config.SQS_CONSUMER_SETTINGS['delete_batch_size'],
+                Config.SQS_CONSUMER_SETTINGS['delete_flush_interval']
+            )
+            self.delete_batchers[queue_url] = batcher
+        return batcher
+    
+    def acknowledge(self, queue_url: str, receipt_handle: str, message_id: str = 'unknown') -> asyncio.Future:
+        """Queue a message for deletion without waiting for the batch, logging the outcome when it completes"""
+        ack_seconds = metrics.histogram('sqs_ack_seconds', queue=self.queue_label(queue_url))
+        ack_start = time.perf_counter()
+        
+        def done(future: asyncio.Future):
+            ack_seconds.observe(time.perf_counter() - ack_start)
+            if future.cancelled():
+                logger.error(f"Delete of message {message_id} was cancelled - it will be redelivered")
+            elif future.exception() is not None:
+                logger.error(f"Failed to delete message {message_id} from queue: {future.exception()}")
+            elif future.result():
+                logger.debug(f"Deleted message {message_id} from queue")
+            else:
+                logger.error(f"Failed to delete message {message_id} from queue - it will be redelivered")
+        
+        future = self._get_delete_batcher(queue_url).delete(receipt_handle, message_id)
+        future.add_done_callback(done)
+        return future
+    
+    def send_pending_deletes(self, queue_url: str):
+        """Start deleting a queue's batched acknowledgements now instead of after the linger interval"""
+        batcher = self.delete_batchers.get(queue_url)
+        if batcher is not None and batcher.pending_count:
+            batcher.send_pending()
+    
+    async def release_messages(self, queue_url: str, messages: list):
+        """Make received messages visible again immediately so another consumer can pick them up"""
+        for start in range(0, len(messages), SQS_MAX_BATCH_ENTRIES):
+            chunk = messages[start:start + SQS_MAX_BATCH_ENTRIES]
+            try:
+                response = await self._call(
+                    'ChangeMessageVisibilityBatch',
+                    QueueUrl=queue_url,
+                    Entries=[
+                        {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle'], 'VisibilityTimeout': 0}
+                        for i, message in enumerate(chunk)
+                    ]
+                )
+                for failure in response.get('Failed', []):
+                    message_id = chunk[int(failure['Id'])].get('MessageId', 'unknown')
+                    logger.warning(f"Failed to release message {message_id}: {failure.get('Code')} - {failure.get('Message')}")
+            except Exception as e:
+                logger.error(f"Failed to release {len(chunk)} messages back to queue: {e}")
+    
+    async def flush_sends(self):
+        """Send every buffered outgoing message now"""
+        for batcher in list(self.send_batchers.values()):
+            await batcher.flush()
+    
+    async def flush_deletes(self, queue_url: Optional[str] = None):
+        """Flush pending deletes for one queue, or for every queue"""
+        if queue_url is None:
+            batchers = list(self.delete_batchers.values())
+        else:
+            batchers = [self.delete_batchers[queue_url]] if queue_url in self.delete_batchers else []
+
+        for batcher in batchers:
+            await batcher.flush()
+    
+    def get_quarantine_store(self) -> QuarantineStore:
+        """Get the local quarantine store, opening it on first use"""
+        if self.quarantine is None:
+            self.quarantine = QuarantineStore(Config.SQS_QUARANTINE_DB)
+        return self.quarantine
+    
+    async def _quarantine_if_exhausted(self, message: Dict[str, Any], queue_url: str, failure: str) -> bool:
+        """Quarantine a message after a retryable failure once it has been received max_receive_count times"""
+        message_id = message.get('MessageId', 'unknown')
+        receive_count = int(message.get('Attributes', {}).get('ApproximateReceiveCount', 0))
+        threshold = Config.SQS_CONSUMER_SETTINGS['max_receive_count']
+        
+        # 0 leaves retryable failures to the queue's own redrive policy
+        if not threshold or receive_count < threshold:
+            logger.info(f"Message {message_id} left on the queue for retry (receive {receive_count}/{threshold or 'unbounded'})")
+            return False
+        
+        logger.warning(f"Message {message_id} failed on receive {receive_count}/{threshold}, last failure: {failure}")
+        return await self._quarantine(message, queue_url, 'max_receives')
+    
+    async def _quarantine(self, message: Dict[str, Any], queue_url: str, reason: str) -> bool:
+        """Move a message off its queue into the dead-letter queue or the local quarantine store"""
+        message_id = message.get('MessageId', 'unknown')
+        receive_count = int(message.get('Attributes', {}).get('ApproximateReceiveCount', 0))
+        
+        try:
+            if not await self._send_to_dead_letter_queue(message, queue_url, reason):
+                entry_id = self.get_quarantine_store().add(message, queue_url, receive_count, reason)
+                logger.warning(f"Quarantined message {message_id} as {entry_id} after {receive_count} receives: {reason}")
+        except Exception as e:
+            logger.error(f"Failed to quarantine message {message_id}: {e}")
+            return False
+        
+        # Remove it right away so it stops consuming receive capacity
+        try:
+            await self._call('DeleteMessage', QueueUrl=queue_url, ReceiptHandle=message['ReceiptHandle'])
+        except Exception as e:
+            logger.error(f"Failed to delete quarantined message {message_id} from queue: {e}")
+        return True
+    
+    async def _send_to_dead_letter_queue(self, message: Dict[str, Any], queue_url: str, reason: str) -> bool:
+        """Forward a poison message to the configured dead-letter queue"""
+        if not Config.SQS_DEAD_LETTER_QUEUE_URL:
+            return False
+        
+        message_id = message.get('MessageId', 'unknown')
+        attributes = dict(message.get('MessageAttributes', {}))
+        # SQS allows at most 10 message attributes, so the diagnostics are added only when they fit
+        if len(attributes) <= 8:
+            attributes.update(self._format_message_attributes({
+                'quarantine_reason': reason[:256],
+                'source_queue': queue_url
+            }))
+        
+        try:
+            await self._call(
+                'SendMessage',
+                QueueUrl=Config.SQS_DEAD_LETTER_QUEUE_URL,
+                MessageBody=message['Body'],
+                MessageAttributes=attributes
+            )
+            logger.warning(f"Moved message {message_id} to dead-letter queue: {reason}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send message {message_id} to dead-letter queue, using local quarantine: {e}")
+            return False
+    
+    def list_quarantined(self, limit: int = 10) -> list:
+        """List the most recently quarantined messages"""
+        return self.get_quarantine_store().list(limit)
+    
+    async def redrive_quarantined(self, entry_id: str) -> bool:
+        """Send a quarantined message back to the queue it came from"""
+        if not self.sqs:
+            logger.error("SQS client not initialized")
+            return False
+        
+        store = self.get_quarantine_store()
+        entry = store.get(entry_id)
+        if entry is None:
+            logger.error(f"Quarantine entry {entry_id} not found")
+            return False
+        
+        try:
+            await self._call(
+                'SendMessage',
+                QueueUrl=entry['queue_url'],
+                MessageBody=entry['body'],
+                MessageAttributes=entry['message_attributes']
+            )
+        except Exception as e:
+            logger.error(f"Failed to re-drive quarantine entry {entry_id}: {e}")
+            return False
+        
+        store.remove(entry_id)
+        logger.info(f"Re-drove quarantined message {entry['message_id']} ({entry_id}) to {entry['queue_url']}")
+        return True
+    
     async def start_consumer(self, queue_name: str, message_handler: Callable, 
-                            max_messages: int = 10, wait_time: int = 20):
-        """Start consuming messages from an SQS queue with enhanced monitoring"""
+                            max_messages: int = 10, wait_time: int = 20,
+                            workers: Optional[int] = None, buffer_size: Optional[int] = None,
+                            pollers: Optional[int] = None, message_priority: Optional[Callable] = None):
+        """Start consuming messages from an SQS queue (name or URL) with enhanced monitoring"""
         if not self.sqs:
             logger.error("SQS client not initialized")
             return
             
-        queue_url = self.get_queue_url(queue_name)
+        queue_url = await self.get_queue_url(queue_name)
         if not queue_url:
             return
+        
+        pipeline = SQSConsumerPipeline(
+            self,
+            queue_name,
+            queue_url,
+            message_handler,
+            max_messages,
+            wait_time,
+            workers or Config.SQS_CONSUMER_SETTINGS['workers'],
+            buffer_size or Config.SQS_CONSUMER_SETTINGS['buffer_size'],
+            pollers or Config.SQS_CONSUMER_SETTINGS['pollers'],
+            message_priority
+        )
+        self.consumers[queue_name] = pipeline
+        
+        # Queue depth is sampled in the background instead of before every receive
+        self.get_queue_sampler(queue_url)
             
         logger.info(f"Starting SQS consumer for queue: {queue_name}")
-        logger.info(f"Consumer settings: max_messages={max_messages}, wait_time={wait_time}s")
+        logger.info(f"Consumer settings: max_messages={max_messages}, wait_time={wait_time}s, "
+                    f"workers={pipeline.worker_target}, buffer_size={pipeline.buffer_size}, pollers={pipeline.poller_target}, "
+                    f"adaptive_polling={pipeline.tuner is not None}")
         
         # Start health monitoring
         health_task = asyncio.create_task(self._health_monitor(queue_name))
         
         try:
-            while True:
-                try:
-                    # Log queue depth periodically
-                    await self._log_queue_status(queue_name)
-                    
-                    # Use asyncio.to_thread to run boto3 calls in a thread pool
-                    # This prevents blocking the main event loop
-                    loop = asyncio.get_event_loop()
-                    response = await loop.run_in_executor(
-                        None,
-                        lambda: self.sqs.receive_message(
-                            QueueUrl=queue_url,
-                            MaxNumberOfMessages=max_messages,
-                            WaitTimeSeconds=wait_time,
-                            MessageAttributeNames=['All']
-                        )
-                    )
-                    
-                    messages = response.get('Messages', [])
-                    if messages:
-                        self.last_message_time = time.time()
-                        self.message_count += len(messages)
-                        logger.info(f"Received {len(messages)} messages from queue '{queue_name}' (total: {self.message_count})")
-                        
-                        # Process messages concurrently to avoid blocking
-                        tasks = []
-                        for message in messages:
-                            task = asyncio.create_task(self._process_single_message(
-                                message, message_handler, queue_url
-                            ))
-                            tasks.append(task)
-                        
-                        # Wait for all messages to be processed with timeout
-                        if tasks:
-                            try:
-                                await asyncio.wait_for(
-                                    asyncio.gather(*tasks, return_exceptions=True),
-                                    timeout=60  # 1 minute timeout for message processing
-                                )
-                            except asyncio.TimeoutError:
-                                logger.error(f"Message processing timed out for {len(tasks)} messages")
-                                # Cancel any remaining tasks
-                                for task in tasks:
-                                    if not task.done():
-                                        task.cancel()
-                    else:
-                        # Log when no messages are received (but not too frequently)
-                        current_time = time.time()
-                        if current_time - self.last_message_time > 300:  # 5 minutes
-                            logger.debug(f"No messages received from queue '{queue_name}' in the last 5 minutes")
-                                
-                except Exception as e:
-                    self.error_count += 1
-                    logger.error(f"Error receiving messages from queue '{queue_name}': {e}")
-                    logger.error(f"Error count: {self.error_count}")
-                    await asyncio.sleep(5)  # Wait before retrying
+            await pipeline.run()
                     
         except asyncio.CancelledError:
             logger.info(f"SQS consumer for queue '{queue_name}' was cancelled")
         except Exception as e:
             logger.error(f"SQS consumer for queue '{queue_name}' encountered fatal error: {e}")
         finally:
+            if self.consumers.get(queue_name) is pipeline:
+                del self.consumers[queue_name]
+            
+            # Acknowledge everything already processed before stopping
+            await self.flush_deletes(queue_url)
+            
             # Cancel health monitoring
             health_task.cancel()
             try:
@@ -221,6 +485,22 @@ class SQSClient:
                 pass
             logger.info(f"SQS consumer for queue '{queue_name}' stopped")
     
+    async def drain_consumer(self, queue_name: str, timeout: float) -> Optional[Dict[str, int]]:
+        """Gracefully stop a running consumer: finish in-flight work, return unstarted messages and flush acks and responses"""
+        pipeline = self.consumers.get(queue_name)
+        if pipeline is None:
+            return None
+        
+        logger.info(f"Draining SQS consumer for queue '{queue_name}' (timeout {timeout}s)")
+        summary = await pipeline.drain(timeout)
+        
+        await self.flush_deletes(pipeline.queue_url)
+        await self.flush_sends()
+        
+        logger.info(f"Drained SQS consumer for queue '{queue_name}': {summary['finished']} finished, "
+                    f"{summary['abandoned']} abandoned, {summary['released']} released unstarted")
+        return summary
+    
     async def _health_monitor(self, queue_name: str):
         """Monitor consumer health and log status"""
         while True:
@@ -230,11 +510,11 @@ class SQSClient:
                 current_time = time.time()
                 time_since_last_message = current_time - self.last_message_time
                 
-                # Get queue attributes
-                attributes = await self.get_queue_attributes(queue_name)
-                if attributes:
-                    depth = int(attributes.get('ApproximateNumberOfMessages', 0))
-                    in_flight = int(attributes.get('ApproximateNumberOfMessagesNotVisible', 0))
+                # Read queue metrics from the shared sampler
+                queue_stats = await self.get_queue_metrics(queue_name)
+                if queue_stats:
+                    depth = queue_stats['depth']
+                    in_flight = queue_stats['in_flight']
                     
                     logger.info(f"Queue '{queue_name}' health: depth={depth}, in_flight={in_flight}, "
                               f"last_message={time_since_last_message:.1f}s ago, "
@@ -257,84 +537,125 @@ class SQSClient:
                 logger.error(f"Health monitor error: {e}")
                 await asyncio.sleep(60)  # Wait before retrying
     
-    async def _log_queue_status(self, queue_name: str):
-        """Log queue status periodically"""
+    def _log_queue_status(self, queue_name: str, queue_url: str):
+        """Log queue status periodically from the sampler's cached metrics (no API call)"""
+        sampler = self.samplers.get(queue_url)
+        queue_stats = sampler.peek() if sampler else None
+        if not queue_stats:
+            return
+        
+        # Log queue depth every 5 minutes
+        current_time = time.time()
+        if not hasattr(self, '_last_queue_log') or current_time - getattr(self, '_last_queue_log', 0) > 300:
+            logger.info(f"Queue '{queue_name}' status: depth={queue_stats['depth']}, in_flight={queue_stats['in_flight']} "
+                        f"(sampled {QueueMetricsSampler.age(queue_stats):.0f}s ago)")
+            self._last_queue_log = current_time
+    
+    async def _run_with_heartbeat(self, handler_coro, queue_url: str, receipt_handle: str, message_id: str):
+        """Await a handler, extending the message's visibility timeout until it finishes or exceeds its lifetime"""
+        interval = Config.SQS_CONSUMER_SETTINGS['heartbeat_interval']
+        extension = Config.SQS_CONSUMER_SETTINGS['visibility_extension']
+        max_lifetime = Config.SQS_CONSUMER_SETTINGS['max_message_lifetime']
+        
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + max_lifetime
+        handler_task = asyncio.ensure_future(handler_coro)
+        
         try:
-            attributes = await self.get_queue_attributes(queue_name)
-            if attributes:
-                depth = int(attributes.get('ApproximateNumberOfMessages', 0))
-                in_flight = int(attributes.get('ApproximateNumberOfMessagesNotVisible', 0))
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.error(f"Handler for message {message_id} exceeded its maximum lifetime of {max_lifetime}s")
+                    raise asyncio.TimeoutError()
                 
-                # Log queue depth every 5 minutes
-                current_time = time.time()
-                if not hasattr(self, '_last_queue_log') or current_time - getattr(self, '_last_queue_log', 0) > 300:
-                    logger.info(f"Queue '{queue_name}' status: depth={depth}, in_flight={in_flight}")
-                    self._last_queue_log = current_time
-                    
-        except Exception as e:
-            logger.debug(f"Could not log queue status: {e}")
+                done, _ = await asyncio.wait({handler_task}, timeout=min(interval, remaining))
+                if handler_task in done:
+                    return handler_task.result()
+                
+                # Still working - renew the lease so the message is not redelivered to another consumer
+                try:
+                    await self._call(
+                        'ChangeMessageVisibility',
+                        QueueUrl=queue_url,
+                        ReceiptHandle=receipt_handle,
+                        VisibilityTimeout=extension
+                    )
+                    logger.debug(f"Extended visibility of message {message_id} by {extension}s")
+                except Exception as e:
+                    logger.warning(f"Failed to extend visibility of message {message_id}: {e}")
+        finally:
+            if not handler_task.done():
+                handler_task.cancel()
+                try:
+                    await handler_task
+                except (asyncio.CancelledError, Exception):
+                    pass
     
-    async def _process_single_message(self, message: Dict[str, Any], message_handler: Callable, queue_url: str):
-        """Process a single SQS message with timeout protection"""
+    async def _process_single_message(self, message: Dict[str, Any], message_handler: Callable, queue_url: str,
+                                      body: Optional[LazyMessageBody] = None):
+        """Process a single SQS message with timeout protection, reusing the body view the poller already made"""
         message_id = message.get('MessageId', 'unknown')
         receipt_handle = message.get('ReceiptHandle', 'unknown')
+        queue = self.queue_label(queue_url)
+        outcome = 'error'
         
         logger.info(f"Processing SQS message {message_id}")
         logger.debug(f"Message details: {message}")
         
         try:
-            # Parse message body
-            try:
-                body = json.loads(message['Body'])
-                logger.debug(f"Parsed message body: {body}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON for message {message_id}: {e}")
-                logger.error(f"Raw message body: {message.get('Body', 'No body')}")
-                # Don't delete the message so it can be retried
-                return
+            # The body is parsed on first access, so handlers can route on message attributes without decoding it
+            if body is None:
+                body = LazyMessageBody.for_message(message)
             
-            # Process message asynchronously with timeout
+            # Process message asynchronously, extending its visibility while the handler runs
             start_time = asyncio.get_event_loop().time()
             try:
-                result = await asyncio.wait_for(
+                result = await self._run_with_heartbeat(
                     message_handler(body, message),
-                    timeout=30  # 30 second timeout for message processing
+                    queue_url,
+                    receipt_handle,
+                    message_id
                 )
                 processing_time = asyncio.get_event_loop().time() - start_time
+                metrics.histogram('sqs_handle_seconds', queue=queue).observe(processing_time)
                 
                 if result:
+                    outcome = 'success'
                     logger.info(f"Successfully processed message {message_id} in {processing_time:.2f}s")
                     
-                    # Delete message after successful processing using thread pool
+                    # Delete message after successful processing. The ack is batched with others and not awaited,
+                    # so the worker moves on to the next message instead of sitting out the batch linger
                     try:
-                        loop = asyncio.get_event_loop()
-                        await loop.run_in_executor(
-                            None,
-                            lambda: self.sqs.delete_message(
-                                QueueUrl=queue_url,
-                                ReceiptHandle=receipt_handle
-                            )
-                        )
-                        logger.debug(f"Deleted message {message_id} from queue")
+                        self.acknowledge(queue_url, receipt_handle, message_id)
                     except Exception as e:
                         logger.error(f"Failed to delete message {message_id} from queue: {e}")
                         logger.error(f"Error type: {type(e).__name__}")
                         # This is a critical error - we don't want to reprocess the message
                         logger.error(f"Full traceback: {traceback.format_exc()}")
                 else:
+                    # Failures are retried by redelivery until the message runs out of receives
+                    outcome = 'failure'
                     logger.error(f"Message handler returned False for message {message_id} in {processing_time:.2f}s")
-                    # Don't delete the message so it can be retried
+                    await self._quarantine_if_exhausted(message, queue_url, "Handler returned False")
                     
             except asyncio.TimeoutError:
+                outcome = 'timeout'
                 logger.error(f"Message processing timed out for message {message_id}")
-                # Don't delete the message so it can be retried
+                await self._quarantine_if_exhausted(message, queue_url, "Handler timed out")
                 
+        except PermanentMessageError as e:
+            # Malformed or invalid messages fail the same way on every delivery, so they are not retried
+            outcome = 'rejected'
+            logger.error(f"Rejected message {message_id}: {e}")
+            await self._quarantine(message, queue_url, f"{type(e).__name__}: {e}")
         except Exception as e:
             logger.error(f"Error processing message {message_id}: {e}")
             logger.error(f"Error type: {type(e).__name__}")
             logger.error(f"Message: {message}")
             logger.error(f"Full traceback: {traceback.format_exc()}")
-            # Don't delete the message so it can be retried
+            await self._quarantine_if_exhausted(message, queue_url, f"{type(e).__name__}: {e}")
+        finally:
+            metrics.counter('sqs_messages_processed_total', queue=queue, outcome=outcome).inc()
     
     async def send_order_placed(self, order_data: Dict[str, Any]) -> bool:
         """Send order placed event to SQS"""
@@ -369,6 +690,18 @@ class SQSClient:
             }
         )
 
+    async def close(self):
+        """Flush pending sends and acknowledgements and release the transport's network resources"""
+        if self.sqs:
+            for sampler in list(self.samplers.values()):
+                await sampler.stop()
+            await self.flush_sends()
+            await self.flush_deletes()
+            await self.sqs.close()
+        if self.quarantine:
+            self.quarantine.close()
+            self.quarantine = None
+
     def get_health_status(self) -> Dict[str, Any]:
         """Get current health status of the SQS client"""
         current_time = time.time()
@@ -377,5 +710,268 @@ class SQSClient:
             'time_since_last_message': current_time - self.last_message_time,
             'message_count': self.message_count,
             'error_count': self.error_count,
-            'client_initialized': self.sqs is not None
+            'client_initialized': self.sqs is not None,
+            'quarantined': self.quarantine.count() if self.quarantine else 0,
+            'consumers': {
+                queue_name: {
+                    'workers': pipeline.worker_target,
+                    'pollers': pipeline.poller_target,
+                    'buffered': pipeline.buffered,
+                    'in_progress': pipeline.in_progress,
+                    'average_latency': pipeline.average_latency,
+                    'receive_batch': pipeline.tuner.batch_size if pipeline.tuner else pipeline.max_messages,
+                    'receive_wait': pipeline.tuner.wait_time if pipeline.tuner else pipeline.wait_time,
+                    'arrival_rate': pipeline.tuner.arrival_rate if pipeline.tuner else None
+                }
+                for queue_name, pipeline in self.consumers.items()
+            }
         }
+
+
+class SQSConsumerPipeline:
+    """Decoupled receive/process loop: pollers fill a bounded buffer that a pool of workers drains"""
+    
+    def __init__(self, sqs_client: SQSClient, queue_name: str, queue_url: str, message_handler: Callable,
+                 max_messages: int, wait_time: int, workers: int, buffer_size: int, pollers: int = 1,
+                 message_priority: Optional[Callable] = None):
+        self.sqs_client = sqs_client
+        self.queue_name = queue_name
+        self.queue_url = queue_url
+        self.message_handler = message_handler
+        self.max_messages = max_messages
+        self.wait_time = wait_time
+        self.worker_target = max(1, workers)
+        self.poller_target = max(1, pollers)
+        
+        # Buffered messages are already received, so their visibility timeout is running - keep this small
+        self.buffer_size = max(1, buffer_size)
+        
+        # Buffered messages are handed to workers lowest priority value first, FIFO within a priority
+        self.message_priority = message_priority
+        self.work_queue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        
+        # Metrics for this queue, updated on every receive and hand-off to a worker
+        self.metrics_label = SQSClient.queue_label(queue_url)
+        self._buffered_gauge = metrics.gauge('sqs_buffered_messages', queue=self.metrics_label)
+        self._buffer_wait = metrics.histogram('sqs_buffer_wait_seconds', queue=self.metrics_label)
+        self.in_progress = 0
+        self.recent_latencies = deque(maxlen=100)
+        
+        # Without a tuner every receive uses max_messages and wait_time as configured
+        self.tuner = None
+        if Config.SQS_CONSUMER_SETTINGS['adaptive_polling']:
+            self.tuner = ReceiveTuner(max_messages, wait_time, Config.SQS_CONSUMER_SETTINGS['min_wait_time'])
+        
+        self._workers = set()
+        self._idle_workers = set()
+        self._pollers = set()
+        self._space_available = asyncio.Event()
+        self._space_available.set()
+        self._stopped = asyncio.Event()
+        self._draining = False
+        self._active_messages = {}
+    
+    @property
+    def buffered(self) -> int:
+        """Number of received messages waiting for a worker"""
+        return self.work_queue.qsize()
+    
+    @property
+    def average_latency(self) -> float:
+        """Average handling time in seconds over recently processed messages"""
+        if not self.recent_latencies:
+            return 0.0
+        return sum(self.recent_latencies) / len(self.recent_latencies)
+    
+    def set_workers(self, count: int):
+        """Grow or shrink the worker pool; busy workers retire after their current message"""
+        if self._draining:
+            return
+        self.worker_target = max(1, count)
+        
+        while len(self._workers) < self.worker_target:
+            self._spawn(self._workers, self._work_loop)
+        
+        # Idle workers are waiting on the queue and can be cancelled without losing a message
+        excess = len(self._workers) - self.worker_target
+        for task in list(self._idle_workers)[:max(0, excess)]:
+            self._workers.discard(task)
+            self._idle_workers.discard(task)
+            task.cancel()
+    
+    def set_pollers(self, count: int):
+        """Grow or shrink the number of concurrent receive loops; extra pollers retire after their current receive"""
+        if self._draining:
+            return
+        self.poller_target = max(1, count)
+        
+        while len(self._pollers) < self.poller_target:
+            self._spawn(self._pollers, self._poll_loop)
+    
+    @staticmethod
+    def _spawn(tasks: set, loop_factory: Callable):
+        """Start a loop task tracked in the given set"""
+        task = asyncio.create_task(loop_factory())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    
+    async def run(self):
+        """Run pollers and workers until stopped or cancelled"""
+        self.set_workers(self.worker_target)
+        self.set_pollers(self.poller_target)
+        
+        try:
+            await self._stopped.wait()
+        finally:
+            tasks = list(self._pollers) + list(self._workers)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def stop(self):
+        """Stop the pipeline"""
+        self._stopped.set()
+    
+    async def drain(self, timeout: float) -> Dict[str, int]:
+        """Stop receiving, let in-flight messages finish within the timeout and hand everything else back to the queue"""
+        self._draining = True
+        
+        # Stop receiving (cancelling a long poll only loses messages whose response was already on the wire)
+        pollers = list(self._pollers)
+        for task in pollers:
+            task.cancel()
+        await asyncio.gather(*pollers, return_exceptions=True)
+        
+        # Buffered messages were never started, so other consumers can take them right away
+        unstarted = []
+        while not self.work_queue.empty():
+            _, _, _, message, _ = self.work_queue.get_nowait()
+            unstarted.append(message)
+        
+        for task in list(self._idle_workers):
+            task.cancel()
+        
+        # Workers exit after their current message while draining
+        finished, abandoned = set(), set()
+        busy = list(self._active_messages)
+        if busy:
+            finished, abandoned = await asyncio.wait(busy, timeout=timeout)
+        
+        # Handlers still running at the deadline are cancelled and their messages released for a prompt retry
+        abandoned_messages = [self._active_messages[task] for task in abandoned if task in self._active_messages]
+        if abandoned:
+            logger.warning(f"Abandoning {len(abandoned)} in-flight messages after {timeout}s drain timeout on queue '{self.queue_name}'")
+        for task in abandoned:
+            task.cancel()
+        await asyncio.gather(*abandoned, return_exceptions=True)
+        
+        await self.sqs_client.release_messages(self.queue_url, unstarted + abandoned_messages)
+        
+        self.stop()
+        return {'finished': len(finished), 'abandoned': len(abandoned), 'released': len(unstarted)}
+    
+    def _retire_if_excess(self, tasks: set, target: int) -> bool:
+        """Remove the current task from its pool when the pool is above target"""
+        if len(tasks) > target:
+            tasks.discard(asyncio.current_task())
+            return True
+        return False
+    
+    def _has_backlog(self) -> bool:
+        """Whether the queue's sampled depth shows messages waiting (no API call)"""
+        sampler = self.sqs_client.samplers.get(self.queue_url)
+        queue_stats = sampler.peek() if sampler else None
+        return bool(queue_stats and queue_stats['depth'] > 0)
+    
+    async def _poll_loop(self):
+        """Receive messages whenever the buffer has room"""
+        queue_name = self.queue_name
+        
+        while not self._retire_if_excess(self._pollers, self.poller_target):
+            try:
+                # Back off only while the buffer is full
+                free_slots = self.buffer_size - self.work_queue.qsize()
+                if free_slots <= 0:
+                    self._space_available.clear()
+                    await self._space_available.wait()
+                    continue
+                
+                # Log queue depth periodically
+                self.sqs_client._log_queue_status(queue_name, self.queue_url)
+                
+                batch_size, wait_time = self.max_messages, self.wait_time
+                if self.tuner:
+                    batch_size, wait_time = self.tuner.next_params(self.average_latency, self._has_backlog())
+                batch_size = min(batch_size, free_slots)
+                
+                response = await self.sqs_client._call(
+                    'ReceiveMessage',
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=batch_size,
+                    WaitTimeSeconds=wait_time,
+                    MessageAttributeNames=['All'],
+                    MessageSystemAttributeNames=['ApproximateReceiveCount']
+                )
+                
+                messages = response.get('Messages', [])
+                if self.tuner:
+                    self.tuner.record(len(messages), batch_size)
+                if messages:
+                    self.sqs_client.last_message_time = time.time()
+                    self.sqs_client.message_count += len(messages)
+                    metrics.counter('sqs_messages_received_total', queue=self.metrics_label).inc(len(messages))
+                    logger.info(f"Received {len(messages)} messages from queue '{queue_name}' (total: {self.sqs_client.message_count})")
+                    
+                    received_at = time.monotonic()
+                    for message in messages:
+                        # The worker gets the same body view, so a body decoded to pick a priority is not decoded again
+                        body = LazyMessageBody.for_message(message)
+                        priority = self.message_priority(message, body) if self.message_priority else 0
+                        self.work_queue.put_nowait((priority, next(self._sequence), received_at, message, body))
+                    
+                    self._buffered_gauge.set(self.work_queue.qsize())
+                    
+                    # Let idle workers take these before free space is measured for the next receive
+                    await asyncio.sleep(0)
+                else:
+                    # Log when no messages are received (but not too frequently)
+                    current_time = time.time()
+                    if current_time - self.sqs_client.last_message_time > 300:  # 5 minutes
+                        logger.debug(f"No messages received from queue '{queue_name}' in the last 5 minutes")
+                        
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.sqs_client.error_count += 1
+                logger.error(f"Error receiving messages from queue '{queue_name}': {e}")
+                logger.error(f"Error count: {self.sqs_client.error_count}")
+                await asyncio.sleep(Config.SQS_CONSUMER_SETTINGS['retry_delay'])  # Wait before retrying
+    
+    async def _work_loop(self):
+        """Process buffered messages one at a time"""
+        current = asyncio.current_task()
+        
+        while not self._draining and not self._retire_if_excess(self._workers, self.worker_target):
+            self._idle_workers.add(current)
+            try:
+                _, _, received_at, message, body = await self.work_queue.get()
+            finally:
+                self._idle_workers.discard(current)
+            
+            self._buffer_wait.observe(time.monotonic() - received_at)
+            self._buffered_gauge.set(self.work_queue.qsize())
+            self._space_available.set()
+            self.in_progress += 1
+            self._active_messages[current] = message
+            start_time = time.monotonic()
+            try:
+                await self.sqs_client._process_single_message(message, self.message_handler, self.queue_url, body)
+            finally:
+                self._active_messages.pop(current, None)
+                self.in_progress -= 1
+                self.recent_latencies.append(time.monotonic() - start_time)
+            
+            # With nothing in progress or buffered no further acks can join the pending batch, so send it now
+            if not self.in_progress and not self.work_queue.qsize():
+                self.sqs_client.send_pending_deletes(self.queue_url)
@@ -0,0 +1,379 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, Any, List, Optional
+
+from botocore.exceptions import ClientError
+
+from util import codec
+
+logger = logging.getLogger('SCMarketBot.SQS')
+
+LOCAL_QUEUE_URL_PREFIX = 'http://localhost:9324/000000000000/'
+
+DEFAULT_QUEUE_ATTRIBUTES = {
+    'VisibilityTimeout': '30',
+    'MessageRetentionPeriod': '345600',
+    'DelaySeconds': '0',
+    'ReceiveMessageWaitTimeSeconds': '0',
+    'MaximumMessageSize': '262144'
+}
+
+
+class _LocalQueue:
+    """State of one emulated queue"""
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, str]] = None, created_at: Optional[float] = None):
+        self.name = name
+        self.url = LOCAL_QUEUE_URL_PREFIX + name
+        self.attributes = {**DEFAULT_QUEUE_ATTRIBUTES, **(attributes or {})}
+        self.created_at = created_at or time.time()
+        self.messages: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.receipts: Dict[str, str] = {}
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        """Wake long polls waiting on this queue"""
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class LocalSQSTransport:
+    """In-process stand-in for SQS implementing the subset of the API used by SQSClient"""
+
+    def __init__(self, db_path: Optional[str] = None, auto_create: bool = True):
+        self.auto_create = auto_create
+        self.queues: Dict[str, _LocalQueue] = {}
+        self.call_counts = Counter()
+        self._db = None
+
+        # Optional sqlite backing keeps queue contents across restarts
+        if db_path:
+            self._db = sqlite3.connect(db_path)
+            self._db.execute('CREATE TABLE IF NOT EXISTS queues (name TEXT PRIMARY KEY, attributes TEXT, created_at REAL)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS messages (id TEXT PRIMARY KEY, queue TEXT, body TEXT, '
+                'message_attributes TEXT, sent_at REAL, visible_at REAL, receive_count INTEGER, '
+                'first_receive_at REAL)'
+            )
+            self._db.commit()
+            self._load()
+
+        logger.info(f"Local SQS transport initialized ({'sqlite: ' + db_path if db_path else 'in-memory'})")
+
+    def _load(self):
+        """Restore queues and messages from sqlite"""
+        for name, attributes, created_at in self._db.execute('SELECT name, attributes, created_at FROM queues'):
+            self.queues[name] = _LocalQueue(name, codec.loads(attributes), created_at)
+
+        rows = self._db.execute(
+            'SELECT id, queue, body, message_attributes, sent_at, visible_at, receive_count, first_receive_at '
+            'FROM messages ORDER BY sent_at'
+        )
+        for message_id, queue_name, body, attributes, sent_at, visible_at, receive_count, first_receive_at in rows:
+            queue = self.queues.get(queue_name) or self._create_queue(queue_name)
+            queue.messages[message_id] = {
+                'id': message_id,
+                'body': body,
+                'md5': hashlib.md5(body.encode('utf-8')).hexdigest(),
+                'message_attributes': codec.loads(attributes),
+                'sent_at': sent_at,
+                'visible_at': visible_at,
+                'receive_count': receive_count,
+                'first_receive_at': first_receive_at,
+                'receipt_handle': None
+            }
+
+    def _persist_message(self, queue: _LocalQueue, message: Dict[str, Any]):
+        if self._db is None:
+            return
+        self._db.execute(
+            'INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (message['id'], queue.name, message['body'], codec.dumps(message['message_attributes']),
+             message['sent_at'], message['visible_at'], message['receive_count'], message['first_receive_at'])
+        )
+        self._db.commit()
+
+    def _forget_message(self, message_id: str):
+        if self._db is None:
+            return
+        self._db.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+        self._db.commit()
+
+    @staticmethod
+    def _error(operation: str, code: str, message: str) -> ClientError:
+        return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+    def _create_queue(self, name: str, attributes: Optional[Dict[str, str]] = None) -> _LocalQueue:
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = _LocalQueue(name, attributes)
+            self.queues[name] = queue
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO queues VALUES (?, ?, ?)',
+                                 (name, codec.dumps(queue.attributes), queue.created_at))
+                self._db.commit()
+        return queue
+
+    def _get_queue(self, operation: str, queue_ref: str) -> _LocalQueue:
+        """Look up a queue by name or by the last path segment of any queue URL"""
+        name = queue_ref.rstrip('/').split('/')[-1]
+        queue = self.queues.get(name)
+        if queue is None:
+            if not self.auto_create:
+                raise self._error(operation, 'AWS.SimpleQueueService.NonExistentQueue',
+                                  f"The specified queue {name} does not exist")
+            queue = self._create_queue(name)
+        return queue
+
+    async def request(self, operation: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Dispatch an SQS API operation to the emulator"""
+        handler = getattr(self, f'_op_{operation}', None)
+        if handler is None:
+            raise self._error(operation, 'InvalidAction', f"{operation} is not supported by the local SQS transport")
+        self.call_counts[operation] += 1
+        return await handler(params)
+
+    async def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # Queue management
+
+    async def _op_CreateQueue(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._create_queue(params['QueueName'], params.get('Attributes'))
+        return {'QueueUrl': queue.url}
+
+    async def _op_GetQueueUrl(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {'QueueUrl': self._get_queue('GetQueueUrl', params['QueueName']).url}
+
+    async def _op_GetQueueAttributes(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('GetQueueAttributes', params['QueueUrl'])
+        now = time.time()
+        visible = in_flight = delayed = 0
+        for message in queue.messages.values():
+            if message['visible_at'] <= now:
+                visible += 1
+            elif message['receive_count'] == 0:
+                delayed += 1
+            else:
+                in_flight += 1
+
+        attributes = {
+            **queue.attributes,
+            'ApproximateNumberOfMessages': str(visible),
+            'ApproximateNumberOfMessagesNotVisible': str(in_flight),
+            'ApproximateNumberOfMessagesDelayed': str(delayed),
+            'CreatedTimestamp': str(int(queue.created_at)),
+            'LastModifiedTimestamp': str(int(queue.created_at)),
+            'QueueArn': f'arn:aws:sqs:local:000000000000:{queue.name}'
+        }
+        names = params.get('AttributeNames', ['All'])
+        if 'All' not in names:
+            attributes = {name: value for name, value in attributes.items() if name in names}
+        return {'Attributes': attributes}
+
+    # Sending
+
+    def _enqueue(self, queue: _LocalQueue, entry: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.time()
+        delay = int(entry.get('DelaySeconds', queue.attributes['DelaySeconds']))
+        body = entry['MessageBody']
+        message = {
+            'id': str(uuid.uuid4()),
+            'body': body,
+            'md5': hashlib.md5(body.encode('utf-8')).hexdigest(),
+            'message_attributes': entry.get('MessageAttributes', {}),
+            'sent_at': now,
+            'visible_at': now + delay,
+            'receive_count': 0,
+            'first_receive_at': None,
+            'receipt_handle': None
+        }
+        queue.messages[message['id']] = message
+        self._persist_message(queue, message)
+        return message
+
+    async def _op_SendMessage(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('SendMessage', params['QueueUrl'])
+        message = self._enqueue(queue, params)
+        queue.notify()
+        return {'MessageId': message['id'], 'MD5OfMessageBody': message['md5']}
+
+    async def _op_SendMessageBatch(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('SendMessageBatch', params['QueueUrl'])
+        self._check_batch('SendMessageBatch', params['Entries'])
+        successful = []
+        for entry in params['Entries']:
+            message = self._enqueue(queue, entry)
+            successful.append({'Id': entry['Id'], 'MessageId': message['id'], 'MD5OfMessageBody': message['md5']})
+        queue.notify()
+        return {'Successful': successful, 'Failed': []}
+
+    def _check_batch(self, operation: str, entries: List[Dict[str, Any]]):
+        if not entries:
+            raise self._error(operation, 'AWS.SimpleQueueService.EmptyBatchRequest', 'Batch request contains no entries')
+        if len(entries) > 10:
+            raise self._error(operation, 'AWS.SimpleQueueService.TooManyEntriesInBatchRequest',
+                              f'Maximum number of entries per request are 10. You have sent {len(entries)}.')
+        if len({entry['Id'] for entry in entries}) != len(entries):
+            raise self._error(operation, 'AWS.SimpleQueueService.BatchEntryIdsNotDistinct', 'Batch entry IDs are not distinct')
+
+    # Receiving
+
+    def _collect_visible(self, queue: _LocalQueue, max_messages: int, visibility_timeout: int) -> List[Dict[str, Any]]:
+        now = time.time()
+        received = []
+        for message in queue.messages.values():
+            if len(received) >= max_messages:
+                break
+            if message['visible_at'] > now:
+                continue
+
+            # A new receive invalidates the previous receipt handle
+            if message['receipt_handle']:
+                queue.receipts.pop(message['receipt_handle'], None)
+            message['receipt_handle'] = str(uuid.uuid4())
+            queue.receipts[message['receipt_handle']] = message['id']
+            message['receive_count'] += 1
+            message['first_receive_at'] = message['first_receive_at'] or now
+            message['visible_at'] = now + visibility_timeout
+            self._persist_message(queue, message)
+            received.append(message)
+        return received
+
+    def _next_visible_in(self, queue: _LocalQueue) -> Optional[float]:
+        if not queue.messages:
+            return None
+        return max(0.0, min(message['visible_at'] for message in queue.messages.values()) - time.time())
+
+    async def _op_ReceiveMessage(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('ReceiveMessage', params['QueueUrl'])
+        max_messages = int(params.get('MaxNumberOfMessages', 1))
+        wait_time = int(params.get('WaitTimeSeconds', queue.attributes['ReceiveMessageWaitTimeSeconds']))
+        visibility_timeout = int(params.get('VisibilityTimeout', queue.attributes['VisibilityTimeout']))
+
+        deadline = time.time() + wait_time
+        received = self._collect_visible(queue, max_messages, visibility_timeout)
+        while not received and time.time() < deadline:
+            # Long poll: wait for a send, a visibility change or the next message becoming visible
+            timeout = deadline - time.time()
+            next_visible = self._next_visible_in(queue)
+            if next_visible is not None:
+                timeout = min(timeout, next_visible + 0.01)
+            try:
+                await asyncio.wait_for(queue.changed.wait(), timeout=max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+            received = self._collect_visible(queue, max_messages, visibility_timeout)
+
+        system_names = set(params.get('AttributeNames', [])) | set(params.get('MessageSystemAttributeNames', []))
+        attribute_names = set(params.get('MessageAttributeNames', []))
+        return {'Messages': [self._format_message(message, system_names, attribute_names) for message in received]}
+
+    @staticmethod
+    def _format_message(message: Dict[str, Any], system_names: set, attribute_names: set) -> Dict[str, Any]:
+        formatted = {
+            'MessageId': message['id'],
+            'ReceiptHandle': message['receipt_handle'],
+            'MD5OfBody': message['md5'],
+            'Body': message['body']
+        }
+
+        if system_names:
+            system_attributes = {
+                'ApproximateReceiveCount': str(message['receive_count']),
+                'SentTimestamp': str(int(message['sent_at'] * 1000)),
+                'ApproximateFirstReceiveTimestamp': str(int(message['first_receive_at'] * 1000)),
+                'SenderId': 'LOCAL'
+            }
+            if 'All' not in system_names:
+                system_attributes = {name: value for name, value in system_attributes.items() if name in system_names}
+            formatted['Attributes'] = system_attributes
+
+        if attribute_names and message['message_attributes']:
+            if 'All' in attribute_names or '.*' in attribute_names:
+                formatted['MessageAttributes'] = dict(message['message_attributes'])
+            else:
+                formatted['MessageAttributes'] = {
+                    name: value for name, value in message['message_attributes'].items() if name in attribute_names
+                }
+
+        return formatted
+
+    # Deleting and visibility
+
+    def _resolve_receipt(self, operation: str, queue: _LocalQueue, receipt_handle: str) -> Dict[str, Any]:
+        message_id = queue.receipts.get(receipt_handle)
+        if message_id is None or message_id not in queue.messages:
+            raise self._error(operation, 'ReceiptHandleIsInvalid', f'The receipt handle "{receipt_handle}" is not valid.')
+        return queue.messages[message_id]
+
+    def _delete(self, operation: str, queue: _LocalQueue, receipt_handle: str):
+        message = self._resolve_receipt(operation, queue, receipt_handle)
+        queue.receipts.pop(receipt_handle, None)
+        del queue.messages[message['id']]
+        self._forget_message(message['id'])
+
+    async def _op_DeleteMessage(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('DeleteMessage', params['QueueUrl'])
+        self._delete('DeleteMessage', queue, params['ReceiptHandle'])
+        return {}
+
+    async def _op_DeleteMessageBatch(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('DeleteMessageBatch', params['QueueUrl'])
+        self._check_batch('DeleteMessageBatch', params['Entries'])
+        return self._run_batch('DeleteMessageBatch', params['Entries'],
+                               lambda entry: self._delete('DeleteMessageBatch', queue, entry['ReceiptHandle']))
+
+    def _change_visibility(self, operation: str, queue: _LocalQueue, receipt_handle: str, timeout: int):
+        message = self._resolve_receipt(operation, queue, receipt_handle)
+        if message['visible_at'] <= time.time():
+            raise self._error(operation, 'AWS.SimpleQueueService.MessageNotInflight', 'Message is not in flight')
+        message['visible_at'] = time.time() + int(timeout)
+        self._persist_message(queue, message)
+        queue.notify()
+
+    async def _op_ChangeMessageVisibility(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('ChangeMessageVisibility', params['QueueUrl'])
+        self._change_visibility('ChangeMessageVisibility', queue, params['ReceiptHandle'], params['VisibilityTimeout'])
+        return {}
+
+    async def _op_ChangeMessageVisibilityBatch(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('ChangeMessageVisibilityBatch', params['QueueUrl'])
+        self._check_batch('ChangeMessageVisibilityBatch', params['Entries'])
+        return self._run_batch(
+            'ChangeMessageVisibilityBatch',
+            params['Entries'],
+            lambda entry: self._change_visibility('ChangeMessageVisibilityBatch', queue,
+                                                  entry['ReceiptHandle'], entry['VisibilityTimeout'])
+        )
+
+    @staticmethod
+    def _run_batch(operation: str, entries: List[Dict[str, Any]], apply) -> Dict[str, Any]:
+        successful, failed = [], []
+        for entry in entries:
+            try:
+                apply(entry)
+                successful.append({'Id': entry['Id']})
+            except ClientError as e:
+                failed.append({
+                    'Id': entry['Id'],
+                    'SenderFault': True,
+                    'Code': e.response['Error']['Code'],
+                    'Message': e.response['Error']['Message']
+                })
+        return {'Successful': successful, 'Failed': failed}
+
+    async def _op_PurgeQueue(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        queue = self._get_queue('PurgeQueue', params['QueueUrl'])
+        for message_id in list(queue.messages):
+            self._forget_message(message_id)
+        queue.messages.clear()
+        queue.receipts.clear()
+        return {}
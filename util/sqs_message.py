@@ -0,0 +1,75 @@
+import time
+from collections.abc import Mapping
+from typing import Dict, Any, Iterator, Optional
+
+from util import codec
+from util.metrics import metrics
+
+_DECODE_SECONDS = metrics.histogram('sqs_decode_seconds')
+
+
+def string_attributes(raw_message: Dict[str, Any]) -> Dict[str, str]:
+    """Plain values of a received message's String and Number message attributes"""
+    return {
+        name: attribute['StringValue']
+        for name, attribute in raw_message.get('MessageAttributes', {}).items()
+        if 'StringValue' in attribute
+    }
+
+
+class PermanentMessageError(Exception):
+    """Raised by a message handler when retrying the message cannot help (malformed or invalid content),
+    so the consumer quarantines it instead of leaving it for redelivery"""
+
+
+class MessageDecodeError(PermanentMessageError, codec.DecodeError):
+    """A message body that cannot be decoded; still a DecodeError for handlers that catch those"""
+
+
+class LazyMessageBody(Mapping):
+    """Read-only view of a JSON message body (possibly compressed, per its content_encoding attribute)
+    decoded on first access"""
+
+    __slots__ = ('raw', 'content_encoding', '_data')
+
+    def __init__(self, raw: str, content_encoding: Optional[str] = None):
+        self.raw = raw
+        self.content_encoding = content_encoding
+        self._data = None
+
+    @classmethod
+    def for_message(cls, raw_message: Dict[str, Any]) -> 'LazyMessageBody':
+        """Body of a received SQS message, decoded according to its content_encoding attribute"""
+        return cls(raw_message.get('Body', ''), string_attributes(raw_message).get(codec.CONTENT_ENCODING_ATTRIBUTE))
+
+    @property
+    def decoded(self) -> bool:
+        """Whether the body has been parsed yet"""
+        return self._data is not None
+
+    def _decode(self) -> Dict[str, Any]:
+        if self._data is None:
+            start = time.perf_counter()
+            try:
+                data = codec.decode_body(self.raw, self.content_encoding)
+            except codec.DecodeError as e:
+                raise MessageDecodeError(str(e)) from e
+            _DECODE_SECONDS.observe(time.perf_counter() - start)
+            if not isinstance(data, dict):
+                raise MessageDecodeError(f"Message body is a {type(data).__name__}, not an object")
+            self._data = data
+        return self._data
+
+    def __getitem__(self, key: str) -> Any:
+        return self._decode()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._decode())
+
+    def __len__(self) -> int:
+        return len(self._decode())
+
+    def __repr__(self) -> str:
+        if self._data is not None:
+            return repr(self._data)
+        return f"<undecoded body: {self.raw[:200]}>"
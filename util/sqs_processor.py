@@ -3,6 +3,7 @@ import logging
 from typing import Dict, Any, Optional
 
 from util.config import Config
+from util.sqs_message import PermanentMessageError
 
 logger = logging.getLogger('SCMarketBot.SQSProcessor')
 
@@ -38,8 +39,11 @@ class SQSMessageProcessor:
                 return result
             else:
                 logger.warning(f"Unknown event type: {event_type}")
-                return False
+                raise PermanentMessageError(f"Unknown event type: {event_type}")
                 
+        except PermanentMessageError:
+            # Undecodable bodies and unknown event types are quarantined rather than retried
+            raise
         except Exception as e:
             logger.error(f"Error processing message: {e}")
             return False
@@ -180,6 +184,9 @@ class SQSManager:
                     pass
         
         self.consumer_tasks.clear()
+        
+        if self.sqs_client:
+            await self.sqs_client.close()
         logger.info("Stopped all SQS consumers")
     
     async def send_order_placed(self, order_data: Dict[str, Any]) -> bool:
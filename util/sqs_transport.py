@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+import aiohttp
+import boto3
+from botocore import xform_name
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.config import Config as BotocoreConfig
+from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.session import get_session
+
+from util import codec
+from util.metrics import metrics
+from util.sqs_local import LocalSQSTransport
+
+logger = logging.getLogger('SCMarketBot.SQS')
+
+# Error codes botocore's standard retry mode treats as transient (throttling and request timeouts)
+RETRYABLE_ERROR_CODES = frozenset((
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'ProvisionedThroughputExceededException', 'TransactionInProgressException',
+    'RequestLimitExceeded', 'BandwidthLimitExceeded', 'LimitExceededException', 'RequestThrottled',
+    'SlowDown', 'PriorRequestNotComplete', 'EC2ThrottledException', 'RequestTimeout', 'RequestTimeoutException'
+))
+RETRYABLE_STATUS_CODES = frozenset((500, 502, 503, 504))
+# Cap on the backoff before one retry, as in botocore's standard mode
+MAX_RETRY_BACKOFF = 20
+
+
+class AsyncSQSTransport:
+    """Asyncio-native SQS transport speaking the SQS JSON protocol over a pooled aiohttp connector"""
+
+    def __init__(self, region: str, access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 endpoint_url: Optional[str] = None, pool_size: int = 50, request_timeout: int = 10,
+                 max_attempts: int = 3):
+        self.region = region
+        self.endpoint_url = endpoint_url or f"https://sqs.{region}.amazonaws.com/"
+        self.pool_size = pool_size
+        self.request_timeout = request_timeout
+        # Total tries per request, including the first
+        self.max_attempts = max(1, max_attempts)
+        self._session = None
+
+        # Reuse botocore's credential chain (env vars, shared config, IAM roles) for signing only
+        botocore_session = get_session()
+        if access_key and secret_key:
+            botocore_session.set_credentials(access_key, secret_key)
+        self._credentials = botocore_session.get_credentials()
+        if self._credentials is None:
+            raise NoCredentialsError()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Lazily create the keep-alive HTTP session on the running loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def request(self, operation: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a signed SQS API request and return the decoded response.
+
+        Throttling, 5xx responses and connection errors are retried with capped exponential backoff and full
+        jitter, like boto3's standard retry mode."""
+        body = codec.dumps(params)
+        attempt = 1
+        while True:
+            try:
+                return await self._send(operation, params, body)
+            except (ClientError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_attempts or not self._retryable(e):
+                    raise
+                delay = random.random() * min(MAX_RETRY_BACKOFF, 2 ** (attempt - 1))
+                logger.warning(f"SQS {operation} attempt {attempt}/{self.max_attempts} failed "
+                               f"({type(e).__name__}: {e}), retrying in {delay:.2f}s")
+                metrics.counter('sqs_request_retries_total', operation=operation).inc()
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if not isinstance(error, ClientError):
+            # Dropped or refused connections and timeouts
+            return True
+        if error.response['Error']['Code'] in RETRYABLE_ERROR_CODES:
+            return True
+        return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') in RETRYABLE_STATUS_CODES
+
+    async def _send(self, operation: str, params: Dict[str, Any], body: str) -> Dict[str, Any]:
+        """Sign and send one attempt of a request"""
+        aws_request = AWSRequest(
+            method='POST',
+            url=self.endpoint_url,
+            data=body,
+            headers={
+                'Content-Type': 'application/x-amz-json-1.0',
+                'X-Amz-Target': f'AmazonSQS.{operation}'
+            }
+        )
+        SigV4Auth(self._credentials.get_frozen_credentials(), 'sqs', self.region).add_auth(aws_request)
+
+        # Long polls hold the connection for WaitTimeSeconds, so the timeout has to cover them
+        timeout = aiohttp.ClientTimeout(total=params.get('WaitTimeSeconds', 0) + self.request_timeout)
+        async with self._get_session().post(
+            self.endpoint_url,
+            data=body,
+            headers=dict(aws_request.headers.items()),
+            timeout=timeout
+        ) as resp:
+            payload = await resp.read()
+            if resp.status >= 300:
+                raise self._client_error(operation, resp.status, resp.headers, payload)
+
+            return codec.loads(payload) if payload else {}
+
+    @staticmethod
+    def _client_error(operation: str, status: int, headers, payload: bytes) -> ClientError:
+        """Translate a JSON protocol error into the ClientError raised by boto3"""
+        try:
+            data = codec.loads(payload) if payload else {}
+        except codec.DecodeError:
+            data = None
+        if not isinstance(data, dict):
+            # Proxies and load balancers answer with HTML or plain text rather than an SQS error
+            snippet = payload[:200].decode('utf-8', 'replace').strip()
+            return ClientError({
+                'Error': {'Code': f'HTTP{status}', 'Message': f"Non-JSON error response: {snippet}"},
+                'ResponseMetadata': {'HTTPStatusCode': status}
+            }, operation)
+
+        # The query-compatible header carries the legacy error code (e.g. AWS.SimpleQueueService.NonExistentQueue)
+        query_error = headers.get('x-amzn-query-error')
+        if query_error:
+            code = query_error.split(';')[0]
+        else:
+            code = data.get('__type', 'Unknown').split('#')[-1]
+
+        message = data.get('message') or data.get('Message') or ''
+        return ClientError({
+            'Error': {'Code': code, 'Message': message},
+            'ResponseMetadata': {'HTTPStatusCode': status}
+        }, operation)
+
+    async def close(self):
+        """Close the pooled HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class Boto3SQSTransport:
+    """SQS transport running blocking boto3 calls in its own thread pool"""
+
+    def __init__(self, region: str, access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 endpoint_url: Optional[str] = None, executor_workers: int = 10, max_attempts: int = 3):
+        # One thread per pooled connection, so calls never queue inside botocore for a socket
+        self.executor_workers = max(1, executor_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.executor_workers, thread_name_prefix='sqs')
+        client_config = BotocoreConfig(
+            max_pool_connections=self.executor_workers,
+            retries={'mode': 'standard', 'max_attempts': max(1, max_attempts)}
+        )
+
+        if access_key and secret_key:
+            self.client = boto3.client(
+                'sqs',
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region,
+                endpoint_url=endpoint_url,
+                config=client_config
+            )
+        else:
+            # Try to use IAM roles or default credentials
+            self.client = boto3.client('sqs', region_name=region, endpoint_url=endpoint_url, config=client_config)
+
+        self._queue_wait = metrics.histogram('sqs_executor_queue_wait_seconds')
+        metrics.gauge('sqs_executor_workers').set(self.executor_workers)
+        logger.info(f"boto3 SQS transport using {self.executor_workers} threads and pooled connections")
+
+    async def request(self, operation: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the matching boto3 method on the SQS thread pool to avoid blocking the event loop"""
+        method = getattr(self.client, xform_name(operation))
+        submitted = time.perf_counter()
+        started = []
+
+        def call():
+            started.append(time.perf_counter())
+            return method(**params)
+
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, call)
+        finally:
+            # Time spent waiting for a free thread, i.e. how far SQS I/O is backed up
+            if started:
+                self._queue_wait.observe(started[0] - submitted)
+
+    async def close(self):
+        """Stop the thread pool and close pooled connections"""
+        self.executor.shutdown(wait=False)
+        self.client.close()
+
+
+def create_transport(kind: str, region: str, access_key: Optional[str] = None,
+                     secret_key: Optional[str] = None, endpoint_url: Optional[str] = None,
+                     pool_size: int = 50, local_db: Optional[str] = None, executor_workers: int = 10,
+                     max_attempts: int = 3):
+    """Create the SQS transport selected by configuration"""
+    if kind == 'local':
+        return LocalSQSTransport(local_db)
+    if kind == 'native':
+        return AsyncSQSTransport(region, access_key, secret_key, endpoint_url, pool_size, max_attempts=max_attempts)
+    if kind == 'boto3':
+        return Boto3SQSTransport(region, access_key, secret_key, endpoint_url, executor_workers, max_attempts)
+    raise ValueError(f"Unknown SQS transport: {kind}")